@@ -0,0 +1,15 @@
+"""Composite index for keyset pagination of applications"""
+
+from alembic import op
+
+revision = "0002_app_keyset_index"
+down_revision = "0001_init"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # (requested_at, id) is scanned backwards for ORDER BY requested_at DESC, id DESC
+    op.create_index("ix_app_requested_at_id", "card_application", ["requested_at", "id"])
+
+def downgrade():
+    op.drop_index("ix_app_requested_at_id", table_name="card_application")
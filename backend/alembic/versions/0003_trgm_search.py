@@ -0,0 +1,33 @@
+"""pg_trgm search: normalized client keys and trigram GIN indexes"""
+
+from alembic import op
+
+revision = "0003_trgm_search"
+down_revision = "0002_app_keyset_index"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+
+    # normalized search keys; kept in sync by Postgres, never written by the app
+    op.execute(r"""
+      ALTER TABLE client
+        ADD COLUMN doc_number_norm varchar(40)
+          GENERATED ALWAYS AS (lower(regexp_replace(doc_number, '[^0-9A-Za-z]', '', 'g'))) STORED,
+        ADD COLUMN phone_norm varchar(40)
+          GENERATED ALWAYS AS (regexp_replace(phone, '\D', '', 'g')) STORED
+    """)
+
+    # GIN trigram indexes serve ILIKE/LIKE '%q%' and the similarity operator %
+    op.execute("CREATE INDEX IF NOT EXISTS ix_client_name_trgm ON client USING gin (full_name gin_trgm_ops);")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_client_doc_norm_trgm ON client USING gin (doc_number_norm gin_trgm_ops);")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_client_phone_norm_trgm ON client USING gin (phone_norm gin_trgm_ops);")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_app_no_trgm ON card_application USING gin (application_no gin_trgm_ops);")
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_app_no_trgm;")
+    op.execute("DROP INDEX IF EXISTS ix_client_phone_norm_trgm;")
+    op.execute("DROP INDEX IF EXISTS ix_client_doc_norm_trgm;")
+    op.execute("DROP INDEX IF EXISTS ix_client_name_trgm;")
+    op.execute("ALTER TABLE client DROP COLUMN IF EXISTS phone_norm, DROP COLUMN IF EXISTS doc_number_norm;")
@@ -0,0 +1,40 @@
+"""Daily rollup table for reports"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0004_report_daily"
+down_revision = "0003_trgm_search"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "report_daily",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("branch_id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("channel_id", sa.Integer(), nullable=False),
+        sa.Column("applications", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("approved", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("rejected", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("issued", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("handed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("activated", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("decision_sec", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("decision_n", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("issue_sec", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("issue_n", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("delivery_sec", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("delivery_n", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("activate_sec", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("activate_n", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("rejected_by_reason", postgresql.JSONB(), nullable=False, server_default=sa.text("'{}'::jsonb")),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("day", "branch_id", "product_id", "channel_id"),
+    )
+    # populated by `python -m app.rollup` (run from app.seed on startup)
+
+def downgrade():
+    op.drop_table("report_daily")
@@ -0,0 +1,86 @@
+"""Monthly range partitions for status_history, BRIN index on changed_at"""
+
+from alembic import op
+
+revision = "0005_status_history_partitions"
+down_revision = "0004_report_daily"
+branch_labels = None
+depends_on = None
+
+# Creates the monthly partitions covering [p_from, p_to]. Rows that landed in the default partition
+# for a month are moved into the new partition before it is attached. Called by `python -m app.history`
+# and on API startup.
+ENSURE_FN = """
+CREATE OR REPLACE FUNCTION status_history_ensure_partitions(p_from date, p_to date) RETURNS int AS $$
+DECLARE
+  m date := date_trunc('month', p_from)::date;
+  nxt date;
+  part text;
+  created int := 0;
+BEGIN
+  WHILE m <= p_to LOOP
+    nxt := (m + interval '1 month')::date;
+    part := format('status_history_y%sm%s', to_char(m, 'YYYY'), to_char(m, 'MM'));
+    IF to_regclass(part) IS NULL THEN
+      EXECUTE format('CREATE TABLE %I (LIKE status_history INCLUDING DEFAULTS)', part);
+      EXECUTE format('WITH moved AS (DELETE FROM status_history_default WHERE changed_at >= %L AND changed_at < %L RETURNING *) '
+                     'INSERT INTO %I SELECT * FROM moved', m, nxt, part);
+      EXECUTE format('ALTER TABLE status_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part, m, nxt);
+      created := created + 1;
+    END IF;
+    m := nxt;
+  END LOOP;
+  RETURN created;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+def upgrade():
+    op.execute("ALTER TABLE status_history RENAME TO status_history_old;")
+    op.execute("ALTER TABLE status_history_old RENAME CONSTRAINT status_history_pkey TO status_history_old_pkey;")
+    op.execute("ALTER INDEX ix_status_hist_entity RENAME TO ix_status_hist_entity_old;")
+
+    # the partition key must be part of the primary key
+    op.execute("""
+      CREATE TABLE status_history (
+        id uuid NOT NULL,
+        entity_type varchar(20) NOT NULL,
+        entity_id uuid NOT NULL,
+        status_id integer NOT NULL REFERENCES ref_status(id),
+        changed_at timestamp NOT NULL,
+        changed_by varchar(120),
+        PRIMARY KEY (id, changed_at)
+      ) PARTITION BY RANGE (changed_at);
+    """)
+    # catches rows for months without a partition; the ensure function drains it
+    op.execute("CREATE TABLE status_history_default PARTITION OF status_history DEFAULT;")
+    op.execute("CREATE INDEX ix_status_hist_entity ON status_history (entity_type, entity_id, changed_at);")
+    op.execute("CREATE INDEX ix_status_hist_changed_brin ON status_history USING brin (changed_at);")
+    op.execute(ENSURE_FN)
+
+    op.execute("""
+      SELECT status_history_ensure_partitions(
+        COALESCE((SELECT min(changed_at) FROM status_history_old)::date, current_date),
+        (current_date + interval '3 months')::date)
+    """)
+    op.execute("INSERT INTO status_history SELECT id, entity_type, entity_id, status_id, changed_at, changed_by FROM status_history_old;")
+    op.execute("DROP TABLE status_history_old;")
+
+def downgrade():
+    op.execute("ALTER TABLE status_history RENAME TO status_history_part;")
+    op.execute("ALTER TABLE status_history_part RENAME CONSTRAINT status_history_pkey TO status_history_part_pkey;")
+    op.execute("ALTER INDEX ix_status_hist_entity RENAME TO ix_status_hist_entity_part;")
+    op.execute("""
+      CREATE TABLE status_history (
+        id uuid PRIMARY KEY,
+        entity_type varchar(20) NOT NULL,
+        entity_id uuid NOT NULL,
+        status_id integer NOT NULL REFERENCES ref_status(id),
+        changed_at timestamp NOT NULL,
+        changed_by varchar(120)
+      );
+    """)
+    op.execute("INSERT INTO status_history SELECT * FROM status_history_part;")
+    op.execute("CREATE INDEX ix_status_hist_entity ON status_history (entity_type, entity_id, changed_at);")
+    op.execute("DROP TABLE status_history_part CASCADE;")
+    op.execute("DROP FUNCTION IF EXISTS status_history_ensure_partitions(date, date);")
@@ -0,0 +1,39 @@
+"""Application read model (list/detail documents maintained on write)"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0006_application_view"
+down_revision = "0005_status_history_partitions"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "application_view",
+        sa.Column("id", postgresql.UUID(as_uuid=True), sa.ForeignKey("card_application.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("application_no", sa.String(30), nullable=False),
+        sa.Column("client_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("requested_at", sa.DateTime(), nullable=False),
+        sa.Column("status_code", sa.String(50), nullable=False),
+        sa.Column("client_full_name", sa.Text(), nullable=False),
+        sa.Column("product_name", sa.Text(), nullable=False),
+        sa.Column("branch_name", sa.Text(), nullable=False),
+        sa.Column("batch_no", sa.String(30), nullable=True),
+        sa.Column("batch_status_code", sa.String(50), nullable=True),
+        sa.Column("card_no", sa.String(30), nullable=True),
+        sa.Column("card_status_code", sa.String(50), nullable=True),
+        sa.Column("list_doc", postgresql.JSONB(), nullable=False),
+        sa.Column("detail_doc", postgresql.JSONB(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_app_view_requested", "application_view", ["requested_at", "id"])
+    op.create_index("ix_app_view_status_requested", "application_view", ["status_code", "requested_at"])
+    op.create_index("ix_app_view_client", "application_view", ["client_id"])
+    op.execute("CREATE INDEX ix_app_view_no_trgm ON application_view USING gin (application_no gin_trgm_ops)")
+    # populated by `python -m app.read_model` (run from app.seed on startup)
+
+def downgrade():
+    op.drop_table("application_view")
@@ -0,0 +1,37 @@
+"""Maintained per-batch counters and keyset index on issue_batch"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_batch_counters"
+down_revision = "0006_application_view"
+branch_labels = None
+depends_on = None
+
+COUNTERS = ("applications_count", "cards_count", "cards_issued_count", "cards_activated_count")
+
+def upgrade():
+    for col in COUNTERS:
+        op.add_column("issue_batch", sa.Column(col, sa.Integer(), nullable=False, server_default="0"))
+    # (created_at, id) is scanned backwards for ORDER BY created_at DESC, id DESC
+    op.create_index("ix_issue_batch_created_id", "issue_batch", ["created_at", "id"])
+    op.execute("""
+      UPDATE issue_batch b SET
+        applications_count = x.apps, cards_count = x.cards,
+        cards_issued_count = x.issued, cards_activated_count = x.activated
+      FROM (
+        SELECT bi.batch_id, count(*) AS apps, count(cd.id) AS cards,
+          count(*) FILTER (WHERE cs.code='ISSUED') AS issued,
+          count(*) FILTER (WHERE cs.code='ACTIVATED') AS activated
+        FROM issue_batch_item bi
+        LEFT JOIN card cd ON cd.application_id=bi.application_id
+        LEFT JOIN ref_status cs ON cs.id=cd.status_id
+        GROUP BY bi.batch_id
+      ) x
+      WHERE b.id=x.batch_id
+    """)
+
+def downgrade():
+    op.drop_index("ix_issue_batch_created_id", table_name="issue_batch")
+    for col in COUNTERS:
+        op.drop_column("issue_batch", col)
@@ -0,0 +1,33 @@
+"""Drop the client's generated search columns from stored application_view documents; drop the unused keyset index"""
+
+from alembic import op
+
+revision = "0008_app_view_client_keys"
+down_revision = "0007_batch_counters"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # documents written before the client object excluded doc_number_norm / phone_norm
+    op.execute("""
+      UPDATE application_view SET
+        list_doc = jsonb_set(list_doc, '{client}', (list_doc->'client') - 'doc_number_norm' - 'phone_norm'),
+        detail_doc = jsonb_set(detail_doc, '{client}', (detail_doc->'client') - 'doc_number_norm' - 'phone_norm')
+      WHERE list_doc->'client' ?| array['doc_number_norm', 'phone_norm']
+         OR detail_doc->'client' ?| array['doc_number_norm', 'phone_norm']
+    """)
+    # keyset paging of applications reads application_view (ix_app_view_requested) since 0006;
+    # nothing orders card_application by (requested_at, id) any more. Range filters keep ix_app_requested_at
+    op.drop_index("ix_app_requested_at_id", table_name="card_application")
+
+def downgrade():
+    op.create_index("ix_app_requested_at_id", "card_application", ["requested_at", "id"])
+    # documents as 0007 wrote them: the client object carried its generated search columns
+    op.execute("""
+      UPDATE application_view v SET
+        list_doc = jsonb_set(list_doc, '{client}', (list_doc->'client')
+                   || jsonb_build_object('doc_number_norm', c.doc_number_norm, 'phone_norm', c.phone_norm)),
+        detail_doc = jsonb_set(detail_doc, '{client}', (detail_doc->'client')
+                     || jsonb_build_object('doc_number_norm', c.doc_number_norm, 'phone_norm', c.phone_norm))
+      FROM client c WHERE c.id = v.client_id
+    """)
@@ -0,0 +1,69 @@
+"""Serialize status_history_ensure_partitions callers with an advisory lock"""
+
+from alembic import op
+
+revision = "0009_history_partitions_lock"
+down_revision = "0008_app_view_client_keys"
+branch_labels = None
+depends_on = None
+
+# Same function as 0005, plus a transaction-level advisory lock taken first. Without it, callers that
+# start together all see to_regclass(part) IS NULL and all but one fail with duplicate_table.
+ENSURE_FN = """
+CREATE OR REPLACE FUNCTION status_history_ensure_partitions(p_from date, p_to date) RETURNS int AS $$
+DECLARE
+  m date := date_trunc('month', p_from)::date;
+  nxt date;
+  part text;
+  created int := 0;
+BEGIN
+  -- one caller at a time (API workers start together, seed and the CLI call it too): a concurrent
+  -- caller waits here, then sees the partitions the first one created and skips them
+  PERFORM pg_advisory_xact_lock(hashtext('status_history_ensure_partitions'));
+  WHILE m <= p_to LOOP
+    nxt := (m + interval '1 month')::date;
+    part := format('status_history_y%sm%s', to_char(m, 'YYYY'), to_char(m, 'MM'));
+    IF to_regclass(part) IS NULL THEN
+      EXECUTE format('CREATE TABLE %I (LIKE status_history INCLUDING DEFAULTS)', part);
+      EXECUTE format('WITH moved AS (DELETE FROM status_history_default WHERE changed_at >= %L AND changed_at < %L RETURNING *) '
+                     'INSERT INTO %I SELECT * FROM moved', m, nxt, part);
+      EXECUTE format('ALTER TABLE status_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part, m, nxt);
+      created := created + 1;
+    END IF;
+    m := nxt;
+  END LOOP;
+  RETURN created;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+PREV_ENSURE_FN = """
+CREATE OR REPLACE FUNCTION status_history_ensure_partitions(p_from date, p_to date) RETURNS int AS $$
+DECLARE
+  m date := date_trunc('month', p_from)::date;
+  nxt date;
+  part text;
+  created int := 0;
+BEGIN
+  WHILE m <= p_to LOOP
+    nxt := (m + interval '1 month')::date;
+    part := format('status_history_y%sm%s', to_char(m, 'YYYY'), to_char(m, 'MM'));
+    IF to_regclass(part) IS NULL THEN
+      EXECUTE format('CREATE TABLE %I (LIKE status_history INCLUDING DEFAULTS)', part);
+      EXECUTE format('WITH moved AS (DELETE FROM status_history_default WHERE changed_at >= %L AND changed_at < %L RETURNING *) '
+                     'INSERT INTO %I SELECT * FROM moved', m, nxt, part);
+      EXECUTE format('ALTER TABLE status_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part, m, nxt);
+      created := created + 1;
+    END IF;
+    m := nxt;
+  END LOOP;
+  RETURN created;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+def upgrade():
+    op.execute(ENSURE_FN)
+
+def downgrade():
+    op.execute(PREV_ENSURE_FN)
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from .db import SessionLocal
+from .service import reconcile_batch_counters
+
+# issue_batch counters are applied as deltas by the service write paths; this recomputes them from
+# issue_batch_item/card and reports how many batches had drifted (e.g. after edits made directly in SQL).
+
+
+def main() -> None:
+    with SessionLocal() as db:
+        n = reconcile_batch_counters(db)
+    print(f"issue_batch counters: {n} batches corrected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+from __future__ import annotations
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Callable, Hashable
+import orjson
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from .core.config import settings
+
+
+def _json_default(v: Any):
+    # orjson handles datetime/date/UUID natively; Numeric columns arrive as Decimal
+    if isinstance(v, Decimal):
+        return float(v)
+    return str(v)
+
+
+def encode_json(payload: Any) -> bytes:
+    # Compact UTF-8 like starlette's JSONResponse, via orjson (also the body of every JSON response).
+    return orjson.dumps(payload, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    # the app's default response class: bodies go through encode_json
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def make_etag(body: bytes) -> str:
+    # Strong validator: content hash, so every worker produces the same tag for the same data.
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class RefCache:
+    """Versioned in-process cache of serialized reference payloads.
+
+    Entries are (body, etag) pairs keyed by an arbitrary hashable key. Any directory write
+    calls invalidate(), which bumps the version and drops every entry; a load that started
+    before the bump is not stored, so a stale payload never outlives an invalidation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries: dict[Hashable, tuple[bytes, str]] = {}
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> tuple[bytes, str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            version = self._version
+        if entry is not None:
+            return entry
+
+        body = encode_json(loader())
+        entry = (body, make_etag(body))
+        with self._lock:
+            if self._version == version:
+                self._entries[key] = entry
+        return entry
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+
+ref_cache = RefCache()
+
+
+class TTLCache:
+    """Small thread-safe key/value cache whose entries expire after ttl seconds."""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: dict[Hashable, tuple[float, Any]] = {}
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+
+count_cache = TTLCache(settings.count_cache_ttl_seconds)
+number_stats_cache = TTLCache(settings.number_stats_ttl_seconds)
+
+
+class StatusResolver:
+    """Bidirectional (entity_type, code) <-> id map over ref_status, loaded once per process.
+
+    ref_status is only written by the seed, so the map is reloaded lazily: on first use,
+    after invalidate(), and once on a miss (a status added by another process).
+    """
+
+    def __init__(self):
+        self._ids: dict[tuple[str, str], int] | None = None
+        self._codes: dict[int, tuple[str, str]] = {}
+
+    def load(self, db) -> tuple[dict, dict]:
+        rows = db.execute(text("SELECT id, entity_type, code FROM ref_status")).all()
+        ids = {(r.entity_type, r.code): int(r.id) for r in rows}
+        codes = {v: k for k, v in ids.items()}
+        # codes first: readers check _ids, so both maps are in place once it is set
+        self._codes = codes
+        self._ids = ids
+        return ids, codes
+
+    def invalidate(self) -> None:
+        self._ids = None
+
+    def id(self, db, entity_type: str, code: str) -> int:
+        ids = self._ids
+        if ids is None or (entity_type, code) not in ids:
+            ids, _ = self.load(db)
+        try:
+            return ids[(entity_type, code)]
+        except KeyError:
+            raise ValueError(f"Unknown status {entity_type}/{code}") from None
+
+    def code(self, db, status_id: int) -> str:
+        codes = self._codes if self._ids is not None else {}
+        if status_id not in codes:
+            _, codes = self.load(db)
+        try:
+            return codes[status_id][1]
+        except KeyError:
+            raise ValueError(f"Unknown status id {status_id}") from None
+
+
+status_resolver = StatusResolver()
+
+
+class PdfCache:
+    """Content-addressed cache of rendered PDFs with size-based LRU eviction.
+
+    Entries are grouped by application id so a write to the application can drop all of its
+    renderings at once. With a directory the bytes live on disk ({dir}/{app_id}/{digest}.pdf) and
+    are shared by workers; otherwise they are kept in process memory.
+    """
+
+    def __init__(self, max_bytes: int, directory: str | None = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._index: OrderedDict[str, tuple[str, int]] = OrderedDict()  # digest -> (app_id, size), LRU first
+        self._mem: dict[str, bytes] = {}
+        self._size = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            for app_dir in os.scandir(directory):
+                if app_dir.is_dir():
+                    files = [f for f in os.scandir(app_dir.path) if f.name.endswith(".pdf")]
+                    for f in sorted(files, key=lambda e: e.stat().st_mtime):
+                        self._track(f.name[:-4], app_dir.name, f.stat().st_size)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256("\x1f".join("" if p is None else str(p) for p in parts).encode()).hexdigest()
+
+    def _path(self, app_id: str, digest: str) -> str:
+        return os.path.join(self.directory, app_id, digest + ".pdf")
+
+    def _track(self, digest: str, app_id: str, size: int) -> None:
+        if digest in self._index:
+            self._size -= self._index.pop(digest)[1]
+        self._index[digest] = (app_id, size)
+        self._size += size
+
+    def _drop(self, digest: str) -> None:
+        app_id, size = self._index.pop(digest)
+        self._size -= size
+        if self.directory:
+            try:
+                os.remove(self._path(app_id, digest))
+            except FileNotFoundError:
+                pass
+        else:
+            self._mem.pop(digest, None)
+
+    def get(self, app_id, digest: str) -> bytes | None:
+        app_id = str(app_id)
+        with self._lock:
+            if digest in self._index:
+                self._index.move_to_end(digest)
+                if not self.directory:
+                    return self._mem[digest]
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(app_id, digest), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                if digest in self._index:
+                    self._size -= self._index.pop(digest)[1]
+            return None
+        with self._lock:
+            # may have been rendered by another worker
+            self._track(digest, app_id, len(data))
+        return data
+
+    def put(self, app_id, digest: str, data: bytes) -> None:
+        app_id = str(app_id)
+        if len(data) > self.max_bytes:
+            return
+        if self.directory:
+            path = self._path(app_id, digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        with self._lock:
+            if not self.directory:
+                self._mem[digest] = data
+            self._track(digest, app_id, len(data))
+            while self._size > self.max_bytes and self._index:
+                self._drop(next(iter(self._index)))
+
+    def invalidate(self, app_id) -> None:
+        app_id = str(app_id)
+        with self._lock:
+            for digest in [d for d, (aid, _) in self._index.items() if aid == app_id]:
+                self._drop(digest)
+        if self.directory:
+            shutil.rmtree(os.path.join(self.directory, app_id), ignore_errors=True)
+
+
+pdf_cache = PdfCache(settings.pdf_cache_max_mb * 1024 * 1024, settings.pdf_cache_dir)
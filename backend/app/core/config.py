@@ -9,6 +9,45 @@ class Settings(BaseSettings):
     log_level: str = "INFO"
 
     database_url: str
+    # read endpoints (lists, bundles, reports, print lookups) use an AsyncSession on psycopg's async driver
+    db_async: bool = False
+    # connection pool, per engine and per worker process (0 statement timeout = server default)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle_seconds: int = 1800
+    db_pool_timeout_seconds: float = 30
+    db_statement_timeout_ms: int = 0
+
+    # application/batch/card lists: rows come back from Postgres as JSON text and go out undecoded
+    json_passthrough: bool = True
+
+    # count=estimate on list endpoints reuses a total this young (seconds)
+    count_cache_ttl_seconds: int = 30
+
+    # rendered print forms: kept in memory unless a directory is given; LRU-evicted above the size cap
+    pdf_cache_dir: str | None = None
+    pdf_cache_max_mb: int = 256
+
+    # PDF renderer process pool (0 workers = render inline in the request thread)
+    pdf_workers: int = 2
+    pdf_queue_max: int = 16
+    pdf_render_timeout_seconds: float = 30
+    pdf_retry_after_seconds: int = 5
+    # start the renderers and warm them up (templates, stylesheet, fonts) before serving
+    pdf_warmup: bool = True
+    # bulk batch print: format=pdf merges in one file, larger batches must use format=zip
+    pdf_bulk_merge_max: int = 500
+
+    # business numbers are reserved from the sequences this many at a time per worker (1 = nextval per number)
+    number_block_size: int = 20
+    # /api/metrics/numbers rescans the number columns at most this often (seconds)
+    number_stats_ttl_seconds: int = 300
+
+    # status_history partitions are kept this many months ahead (created on startup / `python -m app.history ensure`)
+    history_partitions_ahead: int = 3
+
+    # bulk application intake: rows per uploaded file
+    intake_max_rows: int = 50000
 
     cors_origins: str = "http://localhost:5173,http://127.0.0.1:5173"
 
@@ -1,11 +1,84 @@
 from __future__ import annotations
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Any, Callable
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 from .core.config import settings
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+
+class _TimedPool:
+    # times every connection checkout so pool starvation shows up in /api/metrics/db
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.wait_stats = {"checkouts": 0, "timeouts": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.wait_stats["timeouts"] += 1
+            raise
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            with self._stats_lock:
+                st = self.wait_stats
+                st["checkouts"] += 1
+                st["wait_ms_total"] += ms
+                st["wait_ms_max"] = max(st["wait_ms_max"], ms)
+
+    def recreate(self):
+        # pool_recycle/invalidation may recreate the pool: keep it timed
+        new = super().recreate()
+        new._stats_lock, new.wait_stats = self._stats_lock, self.wait_stats
+        return new
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            out = dict(self.wait_stats)
+        out["wait_ms_avg"] = out["wait_ms_total"] / out["checkouts"] if out["checkouts"] else None
+        out.update({"size": self.size(), "max_overflow": self._max_overflow, "checked_out": self.checkedout(),
+                    "idle": self.checkedin(), "overflow": max(0, self.overflow())})
+        return out
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def _engine_kwargs() -> dict:
+    kw = dict(pool_pre_ping=True, pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow,
+              pool_recycle=settings.db_pool_recycle_seconds, pool_timeout=settings.db_pool_timeout_seconds)
+    if settings.db_statement_timeout_ms:
+        kw["connect_args"] = {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}
+    return kw
+
+engine = create_engine(settings.database_url, poolclass=TimedQueuePool, **_engine_kwargs())
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Async engine on psycopg3's async driver (same postgresql+psycopg URL), used by read endpoints when
+# DB_ASYNC is on. It has its own connection pool with the same limits.
+async_engine = (create_async_engine(settings.database_url, poolclass=TimedAsyncQueuePool, **_engine_kwargs())
+                if settings.db_async else None)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False) if async_engine else None
+
+
+def pool_metrics() -> dict:
+    out = {"sync": engine.pool.metrics()}
+    if async_engine is not None:
+        out["async"] = async_engine.pool.metrics()
+    return out
+
 class Base(DeclarativeBase):
     pass
 
@@ -15,3 +88,32 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+class Reader:
+    """Runs a service read function `fn(db, *args)` without blocking the event loop.
+
+    With DB_ASYNC the function runs through AsyncSession.run_sync: the same SQL and service code,
+    but every query is awaited on the async driver, so a slow report holds no thread at all.
+    Otherwise it runs on a sync Session in the threadpool, like a plain `def` endpoint.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def __call__(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if isinstance(self.session, AsyncSession):
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+async def get_reader():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield Reader(db)
+    else:
+        db = SessionLocal()
+        try:
+            yield Reader(db)
+        finally:
+            await run_in_threadpool(db.close)
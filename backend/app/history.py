@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import argparse
+from datetime import date, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .core.config import settings
+from .db import SessionLocal
+
+# status_history is range-partitioned by month on changed_at (status_history_yYYYYmMM) with a
+# default partition as a safety net. Partitions are created ahead of time; old months can be
+# detached (kept as standalone tables for archiving) or dropped.
+
+_PART_PREFIX = "status_history_y"
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def ensure_partitions(db: Session, months_ahead: int | None = None) -> int:
+    """Create missing partitions up to months_ahead after the current month; returns how many were created.
+
+    Also covers any month that already has rows in the default partition and moves those rows.
+    """
+    months_ahead = settings.history_partitions_ahead if months_ahead is None else months_ahead
+    today = date.today()
+    stray = db.execute(text("SELECT min(changed_at)::date FROM status_history_default")).scalar()
+    start = min(stray, today) if stray else today
+    end = _month_start(today)
+    for _ in range(months_ahead):
+        end = _month_start(end + timedelta(days=32))
+    n = db.execute(text("SELECT status_history_ensure_partitions(:f, :t)"), {"f": start, "t": end}).scalar_one()
+    db.commit()
+    return int(n)
+
+
+def list_partitions(db: Session) -> list[tuple[str, date]]:
+    rows = db.execute(text("""
+      SELECT c.relname FROM pg_inherits i
+      JOIN pg_class c ON c.oid = i.inhrelid
+      WHERE i.inhparent = 'status_history'::regclass AND c.relname LIKE :p
+      ORDER BY c.relname
+    """), {"p": _PART_PREFIX + "%"}).scalars().all()
+    return [(name, date(int(name[-7:-3]), int(name[-2:]), 1)) for name in rows]
+
+
+def detach_partitions(db: Session, before: date, drop: bool = False) -> list[str]:
+    """Detach (and optionally drop) every monthly partition that ends on or before `before`."""
+    done = []
+    for name, month in list_partitions(db):
+        if _month_start(month + timedelta(days=32)) > before:
+            continue
+        db.execute(text(f'ALTER TABLE status_history DETACH PARTITION "{name}"'))
+        if drop:
+            db.execute(text(f'DROP TABLE "{name}"'))
+        done.append(name)
+    db.commit()
+    return done
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain status_history partitions.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("ensure", help="create partitions for the coming months")
+    p.add_argument("--ahead", type=int, default=None)
+    p = sub.add_parser("detach", help="retention: detach partitions older than a date")
+    p.add_argument("--before", type=date.fromisoformat, required=True)
+    p.add_argument("--drop", action="store_true", help="drop the detached tables instead of keeping them")
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        if args.cmd == "ensure":
+            print(f"status_history: {ensure_partitions(db, args.ahead)} partitions created")
+        else:
+            names = detach_partitions(db, args.before, args.drop)
+            print(f"status_history: {'dropped' if args.drop else 'detached'} {len(names)} partitions: {', '.join(names) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
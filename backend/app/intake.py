@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from uuid import UUID, uuid4
+
+from pydantic import ValidationError
+from sqlalchemy import Integer, String, text
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, rollup, schemas, service
+from .cache import status_resolver
+from .core.config import settings
+from .numbers import allocator
+from .utils import utcnow, make_no
+
+# Bulk application intake (partner channels, salary projects).
+# One row = one application plus either an existing client_id or a new client. Rows are validated
+# with the API schemas, COPY'd into temp staging tables, checked against the directories in one
+# query, numbered from a single app_seq reservation and moved into the real tables set-based,
+# all in one transaction. Invalid rows are reported and skipped; the others are created.
+# What the database would reject (column widths, int4 ids, references) is checked up front so it is
+# reported per row; anything that still trips a constraint aborts the file with IntakeFailed (422).
+
+INTAKE_FORMATS = ("ndjson", "csv")
+
+_CLIENT_COLS = tuple(schemas.ClientCreate.model_fields)
+_APP_COLS = tuple(f for f in schemas.ApplicationCreate.model_fields if f != "client_id")
+
+_REF_CHECKS = (
+    # (error, join, missing)
+    ("product_id: not found", "LEFT JOIN ref_card_product p ON p.id=s.product_id", "p.id IS NULL"),
+    ("tariff_id: not found", "LEFT JOIN ref_tariff_plan t ON t.id=s.tariff_id", "t.id IS NULL"),
+    ("channel_id: not found", "LEFT JOIN ref_channel ch ON ch.id=s.channel_id", "ch.id IS NULL"),
+    ("branch_id: not found", "LEFT JOIN ref_branch b ON b.id=s.branch_id", "b.id IS NULL"),
+    ("delivery_method_id: not found", "LEFT JOIN ref_delivery_method d ON d.id=s.delivery_method_id", "d.id IS NULL"),
+    ("client_id: not found",
+     "LEFT JOIN intake_client ic ON ic.id=s.client_id LEFT JOIN client c ON c.id=s.client_id",
+     "ic.id IS NULL AND c.id IS NULL"),
+)
+# rows the checks above found are locked (FOR KEY SHARE) first, so none can be deleted before commit
+_REF_LOCKS = (
+    ("ref_card_product", "product_id"), ("ref_tariff_plan", "tariff_id"), ("ref_channel", "channel_id"),
+    ("ref_branch", "branch_id"), ("ref_delivery_method", "delivery_method_id"), ("client", "client_id"),
+)
+_INT4_MAX = 2**31 - 1
+
+
+class IntakeFailed(ValueError):
+    # mapped to 422 by the API; the whole file was rolled back
+    def __init__(self, message: str, constraint: str | None = None):
+        super().__init__(message)
+        self.constraint = constraint
+
+
+def _column_limits(table, cols) -> dict[str, tuple[str, int]]:
+    limits = {}
+    for name in cols:
+        t = table.c[name].type
+        if isinstance(t, String) and t.length:
+            limits[name] = ("len", t.length)
+        elif isinstance(t, Integer):
+            limits[name] = ("int", _INT4_MAX)
+    return limits
+
+
+_CLIENT_LIMITS = _column_limits(models.Client.__table__, _CLIENT_COLS)
+_APP_LIMITS = _column_limits(models.CardApplication.__table__, _APP_COLS)
+
+
+# --------------------
+# Parsing
+# --------------------
+
+def _unflatten(raw: dict) -> dict:
+    # CSV columns: application fields as-is, client fields as "client.<field>"; empty cells are omitted
+    row: dict = {}
+    for k, v in raw.items():
+        if k is None or v is None or v.strip() == "":
+            continue
+        v = v.strip()
+        if k == "limits_requested_json":
+            v = json.loads(v)
+        if k.startswith("client."):
+            row.setdefault("client", {})[k[len("client."):]] = v
+        else:
+            row[k] = v
+    return row
+
+
+def parse_rows(body: bytes, fmt: str) -> list[tuple[int, dict | str]]:
+    """(row number, raw row) pairs; a str instead of a dict is a parse error for that row."""
+    if fmt not in INTAKE_FORMATS:
+        raise ValueError("format must be one of: " + ", ".join(INTAKE_FORMATS))
+    data = body.decode("utf-8-sig")
+    rows: list[tuple[int, dict | str]] = []
+    if fmt == "ndjson":
+        for i, line in enumerate(data.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                rows.append((i, json.loads(line)))
+            except json.JSONDecodeError as e:
+                rows.append((i, f"invalid JSON: {e.msg}"))
+    else:
+        reader = csv.DictReader(io.StringIO(data))
+        for raw in reader:
+            try:
+                rows.append((reader.line_num, _unflatten(raw)))
+            except json.JSONDecodeError as e:
+                rows.append((reader.line_num, f"limits_requested_json: invalid JSON: {e.msg}"))
+    if len(rows) > settings.intake_max_rows:
+        raise ValueError(f"Too many rows ({len(rows)} > {settings.intake_max_rows}), split the file")
+    return rows
+
+
+def _error(row_no: int, errors: list[str]) -> dict:
+    return {"row": row_no, "status": "error", "errors": errors}
+
+
+def _column_errors(obj, limits: dict[str, tuple[str, int]], prefix: str = "") -> list[str]:
+    # values the schemas accept but the table columns would not (COPY / INSERT would fail the whole file)
+    errors = []
+    for name, (kind, limit) in limits.items():
+        v = getattr(obj, name)
+        if v is None:
+            continue
+        if kind == "len" and len(v) > limit:
+            errors.append(f"{prefix}{name}: at most {limit} characters")
+        elif kind == "int" and not -limit - 1 <= v <= limit:
+            errors.append(f"{prefix}{name}: out of range")
+    return errors
+
+
+def _validate(rows: list[tuple[int, dict | str]]):
+    valid, errors = [], []
+    for row_no, raw in rows:
+        if isinstance(raw, str):
+            errors.append(_error(row_no, [raw]))
+            continue
+        try:
+            row = schemas.ApplicationIntakeRow.model_validate(raw)
+        except ValidationError as e:
+            errors.append(_error(row_no, [f"{'.'.join(str(x) for x in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()]))
+            continue
+        column_errors = _column_errors(row, _APP_LIMITS)
+        if row.client is not None:
+            column_errors += _column_errors(row.client, _CLIENT_LIMITS, "client.")
+        if column_errors:
+            errors.append(_error(row_no, column_errors))
+        else:
+            valid.append((row_no, row))
+    return valid, errors
+
+
+# --------------------
+# Loading
+# --------------------
+
+def _copy_value(v):
+    return json.dumps(v, ensure_ascii=False) if isinstance(v, dict) else v
+
+
+def _load(db: Session, valid: list[tuple[int, schemas.ApplicationIntakeRow]], by: str | None) -> list[dict]:
+    now = utcnow()
+    client_cols, app_cols = ", ".join(_CLIENT_COLS), ", ".join(_APP_COLS)
+    db.execute(text(f"CREATE TEMP TABLE intake_client ON COMMIT DROP AS "
+                    f"SELECT 0 AS row_no, id, {client_cols} FROM client WITH NO DATA"))
+    db.execute(text(f"CREATE TEMP TABLE intake_app ON COMMIT DROP AS "
+                    f"SELECT 0 AS row_no, id, client_id, application_no, {app_cols} FROM card_application WITH NO DATA"))
+
+    client_ids: dict[int, UUID] = {}
+    app_ids: dict[int, UUID] = {}
+    new_clients: set[int] = set()
+    raw = db.connection().connection.driver_connection  # psycopg connection, same transaction
+    with raw.cursor() as cur:
+        with cur.copy(f"COPY intake_client (row_no, id, {client_cols}) FROM STDIN") as cp:
+            for row_no, r in valid:
+                if r.client is not None:
+                    client_ids[row_no] = uuid4()
+                    new_clients.add(row_no)
+                    cp.write_row([row_no, client_ids[row_no], *(getattr(r.client, c) for c in _CLIENT_COLS)])
+                else:
+                    client_ids[row_no] = r.client_id
+        with cur.copy(f"COPY intake_app (row_no, id, client_id, {app_cols}) FROM STDIN") as cp:
+            for row_no, r in valid:
+                app_ids[row_no] = uuid4()
+                cp.write_row([row_no, app_ids[row_no], client_ids[row_no], *(_copy_value(getattr(r, c)) for c in _APP_COLS)])
+
+    for table, col in _REF_LOCKS:
+        db.execute(text(f"SELECT 1 FROM {table} WHERE id IN (SELECT {col} FROM intake_app) FOR KEY SHARE"))
+    # directory / client references, all rows at once
+    checks = ", ".join(f"CASE WHEN {missing} THEN '{err}' END" for err, _, missing in _REF_CHECKS)
+    bad = db.execute(text(
+        f"SELECT s.row_no, array_remove(ARRAY[{checks}], NULL) AS errors FROM intake_app s "
+        + " ".join(join for _, join, _ in _REF_CHECKS)
+        + " WHERE " + " OR ".join(f"({missing})" for _, _, missing in _REF_CHECKS)
+    )).all()
+    results = [_error(r.row_no, list(r.errors)) for r in bad]
+    if bad:
+        bad_rows = [r.row_no for r in bad]
+        db.execute(text("DELETE FROM intake_app WHERE row_no = ANY(:rows)"), {"rows": bad_rows})
+        db.execute(text("DELETE FROM intake_client WHERE row_no = ANY(:rows)"), {"rows": bad_rows})
+
+    bad_set = {r.row_no for r in bad}
+    good = [row_no for row_no, _ in valid if row_no not in bad_set]
+    if not good:
+        return results
+
+    # one app_seq reservation for the whole file
+    nos = [make_no("APP", now.year, n, 6) for n in allocator.take(db, "app_seq", len(good))]
+    db.execute(text("""
+      UPDATE intake_app s SET application_no = n.no
+      FROM unnest(CAST(:rows AS int[]), CAST(:nos AS text[])) AS n(row_no, no)
+      WHERE s.row_no = n.row_no
+    """), {"rows": good, "nos": nos})
+    # a number already in use (app_seq behind existing data) would violate the unique key: report those rows
+    taken = db.execute(text("""
+      DELETE FROM intake_app s USING card_application a WHERE a.application_no = s.application_no
+      RETURNING s.row_no, s.application_no
+    """)).all()
+    if taken:
+        results += [_error(r.row_no, [f"application_no: {r.application_no} is already in use"]) for r in taken]
+        taken_rows = {r.row_no for r in taken}
+        db.execute(text("DELETE FROM intake_client WHERE row_no = ANY(:rows)"), {"rows": list(taken_rows)})
+        good, nos = [n for n in good if n not in taken_rows], [no for n, no in zip(good, nos) if n not in taken_rows]
+        if not good:
+            return results
+
+    sid = status_resolver.id(db, "application", "NEW")
+    params = {"now": now, "sid": sid, "by": by}
+    db.execute(text(f"""
+      INSERT INTO client (id, client_type, {client_cols}, created_at, updated_at)
+      SELECT id, 'person', {client_cols}, :now, :now FROM intake_client
+    """), params)
+    db.execute(text(f"""
+      INSERT INTO card_application (id, application_no, client_id, {app_cols}, status_id, requested_at, created_at, updated_at)
+      SELECT id, application_no, client_id, {app_cols}, :sid, :now, :now, :now FROM intake_app
+    """), params)
+    db.execute(text("""
+      INSERT INTO status_history (id, entity_type, entity_id, status_id, changed_at, changed_by)
+      SELECT gen_random_uuid(), 'application', id, :sid, :now, :by FROM intake_app
+    """), params)
+    rollup.refresh(db, [app_ids[n] for n in good])
+    service.refresh_app_view(db, [app_ids[n] for n in good])
+
+    for row_no, no in zip(good, nos):
+        results.append({"row": row_no, "status": "created", "application_id": str(app_ids[row_no]),
+                        "application_no": no, "client_id": str(client_ids[row_no]),
+                        "client_created": row_no in new_clients})
+    return results
+
+
+def intake_applications(db: Session, body: bytes, fmt: str, by: str | None = None) -> dict:
+    valid, results = _validate(parse_rows(body, fmt))
+    try:
+        if valid:
+            results += _load(db, valid, by)
+        db.commit()
+    except (IntegrityError, DataError) as e:
+        # a constraint the checks above do not cover: report it instead of a 500
+        db.rollback()
+        diag = getattr(e.orig, "diag", None)
+        raise IntakeFailed(f"rejected by the database, nothing was created: "
+                           f"{getattr(diag, 'message_primary', None) or e.orig}",
+                           getattr(diag, "constraint_name", None)) from None
+    results.sort(key=lambda r: r["row"])
+    created = sum(1 for r in results if r["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
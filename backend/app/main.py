@@ -1,21 +1,34 @@
 from __future__ import annotations
 
+import asyncio
+import csv
+import io
+import logging
+import tempfile
+import zipfile
+from collections import deque
 from datetime import datetime, timedelta, date
 from uuid import UUID
 
-from fastapi import FastAPI, Depends, Query
+from fastapi import FastAPI, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
 from .core.config import settings
-from .db import get_db
-from . import models, schemas, service
+from .db import SessionLocal, get_db, get_reader, Reader, async_engine, pool_metrics
+from .cache import encode_json, FastJSONResponse, ref_cache, pdf_cache
+from . import models, schemas, service, intake, numbers, history
 from . import pdf as pdf_renderer
 
+logging.basicConfig(level=settings.log_level)
+log = logging.getLogger(__name__)
+
 app = FastAPI(
+    default_response_class=FastJSONResponse,
     title="Card Issuance Service",
     version="2.0",
     description="Directories + Applications + Batches + Cards lifecycle + Reports + Print forms (FastAPI + Postgres).",
@@ -29,9 +42,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(pdf_renderer.RenderUnavailable)
+def render_unavailable_handler(_, exc: pdf_renderer.RenderUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+@app.on_event("startup")
+def ensure_history_partitions():
+    # every worker runs this; best-effort: the partitions are also kept by `python -m app.history ensure`,
+    # and rows for a missing month land in the default partition, so a failure here must not stop the API
+    try:
+        with SessionLocal() as db:
+            history.ensure_partitions(db)
+    except Exception:
+        log.exception("status_history partitions not ensured on startup")
+
+@app.on_event("startup")
+async def start_pdf_pool():
+    if settings.pdf_warmup:
+        await run_in_threadpool(pdf_renderer.pool.start)
+
+@app.on_event("shutdown")
+def shutdown_pdf_pool():
+    pdf_renderer.pool.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+
 @app.exception_handler(ValueError)
 def value_error_handler(_, exc: ValueError):
-    return JSONResponse(status_code=400, content={"detail": str(exc)})
+    content = {"detail": str(exc)}
+    if isinstance(exc, service.BatchItemsRejected):
+        content["rejected"] = exc.rejected
+    return JSONResponse(status_code=400, content=content)
+
+@app.exception_handler(intake.IntakeFailed)
+def intake_failed_handler(_, exc: intake.IntakeFailed):
+    return JSONResponse(status_code=422, content={"detail": str(exc), "constraint": exc.constraint})
 
 # ------------------
 # Health / Meta
@@ -41,93 +89,152 @@ def value_error_handler(_, exc: ValueError):
 def health():
     return {"status": "ok"}
 
-@app.get("/api/meta")
-def meta(db: Session = Depends(get_db)):
+@app.get("/api/metrics/db")
+def db_metrics():
+    return pool_metrics()
+
+@app.get("/api/metrics/numbers")
+def numbers_metrics(db: Session = Depends(get_db)):
+    return numbers.gap_stats(db)
+
+@app.get("/api/metrics/pdf")
+def pdf_metrics():
+    return pdf_renderer.pool.metrics()
+
+def _not_modified(request: Request, etag: str) -> bool:
+    tags = [t.strip() for t in request.headers.get("if-none-match", "").split(",")]
+    return etag in tags or "*" in tags
+
+def _ref_response(request: Request, key, loader) -> Response:
+    body, etag = ref_cache.get(key, loader)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _ref_changed(obj=None):
+    # every directory write goes through here so /api/meta and /api/ref/* never serve stale data
+    ref_cache.invalidate()
+    return obj
+
+def _load_meta_refs(db: Session) -> dict:
     refs = service.fetch_ref_map(db)
     return {
-        "refs": {
-            "channels": [schemas.RefItemOut.model_validate(x).model_dump() for x in refs["channels"]],
-            "branches": [schemas.RefBranchOut.model_validate(x).model_dump() for x in refs["branches"]],
-            "delivery_methods": [schemas.RefItemOut.model_validate(x).model_dump() for x in refs["delivery_methods"]],
-            "vendors": [schemas.RefVendorOut.model_validate(x).model_dump() for x in refs["vendors"]],
-            "reject_reasons": [schemas.RefItemOut.model_validate(x).model_dump() for x in refs["reject_reasons"]],
-            "products": [schemas.RefCardProductOut.model_validate(x).model_dump() for x in refs["products"]],
-            "tariffs": [schemas.RefTariffPlanOut.model_validate(x).model_dump() for x in refs["tariffs"]],
-        },
-        "server_time_utc": datetime.utcnow().isoformat(),
+        "channels": schemas.rows_out(schemas.RefItemOut, refs["channels"]),
+        "branches": schemas.rows_out(schemas.RefBranchOut, refs["branches"]),
+        "delivery_methods": schemas.rows_out(schemas.RefItemOut, refs["delivery_methods"]),
+        "vendors": schemas.rows_out(schemas.RefVendorOut, refs["vendors"]),
+        "reject_reasons": schemas.rows_out(schemas.RefItemOut, refs["reject_reasons"]),
+        "products": schemas.rows_out(schemas.RefCardProductOut, refs["products"]),
+        "tariffs": schemas.rows_out(schemas.RefTariffPlanOut, refs["tariffs"]),
     }
 
+@app.get("/api/meta")
+def meta(request: Request, db: Session = Depends(get_db)):
+    # ETag covers "refs" only: server_time_utc is informational and must not defeat revalidation.
+    refs_body, etag = ref_cache.get(("meta",), lambda: _load_meta_refs(db))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    body = b'{"refs":' + refs_body + b',"server_time_utc":"' + datetime.utcnow().isoformat().encode() + b'"}'
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # ------------------
 # Reference (Directories)
 # ------------------
 
-def _page(total: int, limit: int, offset: int, items: list):
-    return {"meta": {"total": total, "limit": limit, "offset": offset}, "items": items}
+def _page_meta(total: service.Total, limit: int, offset: int, meta: dict) -> dict:
+    # total_source tells an exact (or cached exact) count from a planner estimate
+    return {"total": total.value, "total_source": total.source, "limit": limit, "offset": offset, **meta}
+
+def _page(total: service.Total, limit: int, offset: int, items: list, **meta) -> Response:
+    # returned as a response so FastAPI skips its jsonable_encoder pass over the items
+    return FastJSONResponse({"meta": _page_meta(total, limit, offset, meta), "items": items})
+
+def _json_page(total: service.Total, limit: int, offset: int, docs: list[str], **meta) -> Response:
+    # same shape as _page, but items are JSON texts built by Postgres and spliced in undecoded
+    head = encode_json(_page_meta(total, limit, offset, meta))
+    body = b'{"meta":' + head + b',"items":[' + ",".join(docs).encode("utf-8") + b"]}"
+    return Response(content=body, media_type="application/json")
+
+def _list_page(total: service.Total, limit: int, offset: int, items: list, raw: bool, **meta):
+    return _json_page(total, limit, offset, items, **meta) if raw else _page(total, limit, offset, [dict(r) for r in items], **meta)
 
 @app.get("/api/ref/statuses")
-def list_statuses(entity_type: str | None = None, db: Session = Depends(get_db)):
-    stmt = select(models.RefStatus)
-    if entity_type:
-        stmt = stmt.where(models.RefStatus.entity_type == entity_type)
-    items = db.execute(stmt.order_by(models.RefStatus.entity_type, models.RefStatus.sort_order)).scalars().all()
-    return {"items": [{"id": x.id, "entity_type": x.entity_type, "code": x.code, "name": x.name, "sort_order": x.sort_order} for x in items]}
+def list_statuses(request: Request, entity_type: str | None = None, db: Session = Depends(get_db)):
+    def load():
+        stmt = select(models.RefStatus)
+        if entity_type:
+            stmt = stmt.where(models.RefStatus.entity_type == entity_type)
+        items = db.execute(stmt.order_by(models.RefStatus.entity_type, models.RefStatus.sort_order)).scalars().all()
+        return {"items": [{"id": x.id, "entity_type": x.entity_type, "code": x.code, "name": x.name, "sort_order": x.sort_order} for x in items]}
+    return _ref_response(request, ("statuses", entity_type), load)
 
 @app.get("/api/ref/branches")
-def list_branches(active_only: bool = False, db: Session = Depends(get_db)):
-    stmt = select(models.RefBranch)
-    if active_only:
-        stmt = stmt.where(models.RefBranch.is_active == True)
-    items = db.execute(stmt.order_by(models.RefBranch.city, models.RefBranch.name)).scalars().all()
-    return {"items": [schemas.RefBranchOut.model_validate(x).model_dump() for x in items]}
+def list_branches(request: Request, active_only: bool = False, db: Session = Depends(get_db)):
+    def load():
+        stmt = select(models.RefBranch)
+        if active_only:
+            stmt = stmt.where(models.RefBranch.is_active == True)
+        items = db.execute(stmt.order_by(models.RefBranch.city, models.RefBranch.name)).scalars().all()
+        return {"items": schemas.rows_out(schemas.RefBranchOut, items)}
+    return _ref_response(request, ("branches", active_only), load)
 
 @app.post("/api/ref/branches", response_model=schemas.RefBranchOut)
 def create_branch(data: schemas.RefBranchCreate, db: Session = Depends(get_db)):
     obj = models.RefBranch(**data.model_dump())
     db.add(obj); db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.put("/api/ref/branches/{branch_id}", response_model=schemas.RefBranchOut)
 def update_branch(branch_id: int, data: schemas.RefBranchCreate, db: Session = Depends(get_db)):
     obj = db.get(models.RefBranch, branch_id)
     if not obj: raise ValueError("Branch not found")
     for k, v in data.model_dump().items(): setattr(obj, k, v)
+    service.refresh_app_view_for_ref(db, "branch", branch_id)
     db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.get("/api/ref/channels")
-def list_channels(active_only: bool = False, db: Session = Depends(get_db)):
-    stmt = select(models.RefChannel)
-    if active_only:
-        stmt = stmt.where(models.RefChannel.is_active == True)
-    items = db.execute(stmt.order_by(models.RefChannel.name)).scalars().all()
-    return {"items": [schemas.RefItemOut.model_validate(x).model_dump() for x in items]}
+def list_channels(request: Request, active_only: bool = False, db: Session = Depends(get_db)):
+    def load():
+        stmt = select(models.RefChannel)
+        if active_only:
+            stmt = stmt.where(models.RefChannel.is_active == True)
+        items = db.execute(stmt.order_by(models.RefChannel.name)).scalars().all()
+        return {"items": schemas.rows_out(schemas.RefItemOut, items)}
+    return _ref_response(request, ("channels", active_only), load)
 
 @app.post("/api/ref/channels", response_model=schemas.RefItemOut)
 def create_channel(data: schemas.RefItemBase, db: Session = Depends(get_db)):
     obj = models.RefChannel(**data.model_dump())
     db.add(obj); db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.put("/api/ref/channels/{channel_id}", response_model=schemas.RefItemOut)
 def update_channel(channel_id: int, data: schemas.RefItemBase, db: Session = Depends(get_db)):
     obj = db.get(models.RefChannel, channel_id)
     if not obj: raise ValueError("Channel not found")
     for k, v in data.model_dump().items(): setattr(obj, k, v)
+    service.refresh_app_view_for_ref(db, "channel", channel_id)
     db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.get("/api/ref/delivery-methods")
-def list_delivery_methods(active_only: bool = False, db: Session = Depends(get_db)):
-    stmt = select(models.RefDeliveryMethod)
-    if active_only:
-        stmt = stmt.where(models.RefDeliveryMethod.is_active == True)
-    items = db.execute(stmt.order_by(models.RefDeliveryMethod.name)).scalars().all()
-    return {"items": [{"id": x.id, "code": x.code, "name": x.name, "base_cost": float(x.base_cost), "sla_days": x.sla_days, "is_active": x.is_active} for x in items]}
+def list_delivery_methods(request: Request, active_only: bool = False, db: Session = Depends(get_db)):
+    def load():
+        stmt = select(models.RefDeliveryMethod)
+        if active_only:
+            stmt = stmt.where(models.RefDeliveryMethod.is_active == True)
+        items = db.execute(stmt.order_by(models.RefDeliveryMethod.name)).scalars().all()
+        return {"items": [{"id": x.id, "code": x.code, "name": x.name, "base_cost": float(x.base_cost), "sla_days": x.sla_days, "is_active": x.is_active} for x in items]}
+    return _ref_response(request, ("delivery_methods", active_only), load)
 
 @app.post("/api/ref/delivery-methods")
 def create_delivery_method(data: dict, db: Session = Depends(get_db)):
     obj = models.RefDeliveryMethod(**data)
     db.add(obj); db.commit(); db.refresh(obj)
+    _ref_changed()
     return {"id": obj.id}
 
 @app.put("/api/ref/delivery-methods/{dm_id}")
@@ -135,22 +242,26 @@ def update_delivery_method(dm_id: int, data: dict, db: Session = Depends(get_db)
     obj = db.get(models.RefDeliveryMethod, dm_id)
     if not obj: raise ValueError("Delivery method not found")
     for k, v in data.items(): setattr(obj, k, v)
+    service.refresh_app_view_for_ref(db, "delivery", dm_id)
     db.commit()
+    _ref_changed()
     return {"ok": True}
 
 @app.get("/api/ref/vendors")
-def list_vendors(active_only: bool = False, db: Session = Depends(get_db)):
-    stmt = select(models.RefVendor)
-    if active_only:
-        stmt = stmt.where(models.RefVendor.is_active == True)
-    items = db.execute(stmt.order_by(models.RefVendor.vendor_type, models.RefVendor.name)).scalars().all()
-    return {"items": [schemas.RefVendorOut.model_validate(x).model_dump() for x in items]}
+def list_vendors(request: Request, active_only: bool = False, db: Session = Depends(get_db)):
+    def load():
+        stmt = select(models.RefVendor)
+        if active_only:
+            stmt = stmt.where(models.RefVendor.is_active == True)
+        items = db.execute(stmt.order_by(models.RefVendor.vendor_type, models.RefVendor.name)).scalars().all()
+        return {"items": schemas.rows_out(schemas.RefVendorOut, items)}
+    return _ref_response(request, ("vendors", active_only), load)
 
 @app.post("/api/ref/vendors", response_model=schemas.RefVendorOut)
 def create_vendor(data: schemas.RefVendorCreate, db: Session = Depends(get_db)):
     obj = models.RefVendor(**data.model_dump())
     db.add(obj); db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.put("/api/ref/vendors/{vendor_id}", response_model=schemas.RefVendorOut)
 def update_vendor(vendor_id: int, data: schemas.RefVendorCreate, db: Session = Depends(get_db)):
@@ -158,82 +269,92 @@ def update_vendor(vendor_id: int, data: schemas.RefVendorCreate, db: Session = D
     if not obj: raise ValueError("Vendor not found")
     for k, v in data.model_dump().items(): setattr(obj, k, v)
     db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.get("/api/ref/reject-reasons")
-def list_reject_reasons(active_only: bool = False, db: Session = Depends(get_db)):
-    stmt = select(models.RefRejectReason)
-    if active_only:
-        stmt = stmt.where(models.RefRejectReason.is_active == True)
-    items = db.execute(stmt.order_by(models.RefRejectReason.name)).scalars().all()
-    return {"items": [schemas.RefItemOut.model_validate(x).model_dump() for x in items]}
+def list_reject_reasons(request: Request, active_only: bool = False, db: Session = Depends(get_db)):
+    def load():
+        stmt = select(models.RefRejectReason)
+        if active_only:
+            stmt = stmt.where(models.RefRejectReason.is_active == True)
+        items = db.execute(stmt.order_by(models.RefRejectReason.name)).scalars().all()
+        return {"items": schemas.rows_out(schemas.RefItemOut, items)}
+    return _ref_response(request, ("reject_reasons", active_only), load)
 
 @app.post("/api/ref/reject-reasons", response_model=schemas.RefItemOut)
 def create_reject_reason(data: schemas.RefItemBase, db: Session = Depends(get_db)):
     obj = models.RefRejectReason(**data.model_dump())
     db.add(obj); db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.put("/api/ref/reject-reasons/{rr_id}", response_model=schemas.RefItemOut)
 def update_reject_reason(rr_id: int, data: schemas.RefItemBase, db: Session = Depends(get_db)):
     obj = db.get(models.RefRejectReason, rr_id)
     if not obj: raise ValueError("Reject reason not found")
     for k, v in data.model_dump().items(): setattr(obj, k, v)
+    service.refresh_app_view_for_ref(db, "reject_reason", rr_id)
     db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.get("/api/ref/products")
-def list_products(active_only: bool = False, db: Session = Depends(get_db)):
-    stmt = select(models.RefCardProduct)
-    if active_only:
-        stmt = stmt.where(models.RefCardProduct.is_active == True)
-    items = db.execute(stmt.order_by(models.RefCardProduct.payment_system, models.RefCardProduct.level, models.RefCardProduct.name)).scalars().all()
-    return {"items": [schemas.RefCardProductOut.model_validate(x).model_dump() for x in items]}
+def list_products(request: Request, active_only: bool = False, db: Session = Depends(get_db)):
+    def load():
+        stmt = select(models.RefCardProduct)
+        if active_only:
+            stmt = stmt.where(models.RefCardProduct.is_active == True)
+        items = db.execute(stmt.order_by(models.RefCardProduct.payment_system, models.RefCardProduct.level, models.RefCardProduct.name)).scalars().all()
+        return {"items": schemas.rows_out(schemas.RefCardProductOut, items)}
+    return _ref_response(request, ("products", active_only), load)
 
 @app.post("/api/ref/products", response_model=schemas.RefCardProductOut)
 def create_product(data: schemas.RefCardProductCreate, db: Session = Depends(get_db)):
     obj = models.RefCardProduct(**data.model_dump())
     db.add(obj); db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.put("/api/ref/products/{pid}", response_model=schemas.RefCardProductOut)
 def update_product(pid: int, data: schemas.RefCardProductCreate, db: Session = Depends(get_db)):
     obj = db.get(models.RefCardProduct, pid)
     if not obj: raise ValueError("Product not found")
     for k, v in data.model_dump().items(): setattr(obj, k, v)
+    service.refresh_app_view_for_ref(db, "product", pid)
     db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.get("/api/ref/tariffs")
-def list_tariffs(active_only: bool = False, db: Session = Depends(get_db)):
-    stmt = select(models.RefTariffPlan)
-    if active_only:
-        stmt = stmt.where(models.RefTariffPlan.is_active == True)
-    items = db.execute(stmt.order_by(models.RefTariffPlan.name)).scalars().all()
-    return {"items": [schemas.RefTariffPlanOut.model_validate(x).model_dump() for x in items]}
+def list_tariffs(request: Request, active_only: bool = False, db: Session = Depends(get_db)):
+    def load():
+        stmt = select(models.RefTariffPlan)
+        if active_only:
+            stmt = stmt.where(models.RefTariffPlan.is_active == True)
+        items = db.execute(stmt.order_by(models.RefTariffPlan.name)).scalars().all()
+        return {"items": schemas.rows_out(schemas.RefTariffPlanOut, items)}
+    return _ref_response(request, ("tariffs", active_only), load)
 
 @app.post("/api/ref/tariffs", response_model=schemas.RefTariffPlanOut)
 def create_tariff(data: schemas.RefTariffPlanCreate, db: Session = Depends(get_db)):
     obj = models.RefTariffPlan(**data.model_dump())
     db.add(obj); db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 @app.put("/api/ref/tariffs/{tid}", response_model=schemas.RefTariffPlanOut)
 def update_tariff(tid: int, data: schemas.RefTariffPlanCreate, db: Session = Depends(get_db)):
     obj = db.get(models.RefTariffPlan, tid)
     if not obj: raise ValueError("Tariff not found")
     for k, v in data.model_dump().items(): setattr(obj, k, v)
+    service.refresh_app_view_for_ref(db, "tariff", tid)
     db.commit(); db.refresh(obj)
-    return obj
+    return _ref_changed(obj)
 
 # ------------------
 # Clients
 # ------------------
 
 @app.get("/api/clients")
-def clients_list(q: str | None = None, limit: int = 50, offset: int = 0, db: Session = Depends(get_db)):
-    total, items = service.list_clients(db, q, limit, offset)
-    return _page(total, limit, offset, [schemas.ClientOut.model_validate(x).model_dump() for x in items])
+async def clients_list(q: str | None = None, limit: int = 50, offset: int = 0, count: str = "exact", search: str = "contains",
+                       read: Reader = Depends(get_reader)):
+    total, items = await read(service.list_clients, q, limit, offset, count=count, search=search)
+    return _page(total, limit, offset, schemas.rows_out(schemas.ClientOut, items), count=count)
 
 @app.post("/api/clients", response_model=schemas.ClientOut)
 def clients_create(data: schemas.ClientCreate, db: Session = Depends(get_db)):
@@ -254,21 +375,73 @@ def clients_get(client_id: UUID, db: Session = Depends(get_db)):
 # ------------------
 
 @app.get("/api/applications")
-def applications_list(
+async def applications_list(
     q: str | None = None,
     statuses: list[str] | None = Query(default=None),
     date_from: datetime | None = None,
     date_to: datetime | None = None,
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_db),
+    cursor: str | None = None,
+    count: str = "exact",
+    search: str = "contains",
+    fields: str | None = None,
+    read: Reader = Depends(get_reader),
+):
+    # pass cursor= (empty) to start keyset paging, then meta.next_cursor from each page
+    # fields=grid|compact or a comma list of keys / "object.key" paths (service.APP_FIELDS)
+    raw = settings.json_passthrough
+    picked = service.parse_fields(fields, service.APP_FIELD_PRESETS)
+    total, rows, next_cursor = await read(service.list_applications_view, q, statuses, date_from, date_to, limit, offset,
+                                          cursor=cursor, count=count, search=search, raw=raw, fields=picked)
+    if cursor is None:
+        return _list_page(total, limit, offset, rows, raw, count=count)
+    return _list_page(total, limit, 0, rows, raw, count=count, next_cursor=next_cursor)
+
+def _export_value(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return v
+
+def _export_chunks(stmt, fmt: str):
+    # own session: the request's session is closed before a streaming body is consumed
+    with SessionLocal() as db:
+        if fmt == "csv":
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            buf.write("\ufeff")  # BOM so spreadsheet apps detect UTF-8
+            w.writerow([name for name, _ in service.EXPORT_COLUMNS])
+            for part in service.iter_applications_export(db, stmt):
+                w.writerows([_export_value(v) for v in r.values()] for r in part)
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+            yield buf.getvalue().encode("utf-8")
+        else:
+            for part in service.iter_applications_export(db, stmt):
+                yield b"".join(encode_json({k: _export_value(v) for k, v in r.items()}) + b"\n" for r in part)
+
+@app.get("/api/applications/export")
+def applications_export(
+    format: str = "csv",
+    q: str | None = None,
+    statuses: list[str] | None = Query(default=None),
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    search: str = "contains",
 ):
-    total, rows = service.list_applications_view(db, q, statuses, date_from, date_to, limit, offset)
-    return _page(total, limit, offset, [dict(r) for r in rows])
+    # same filters as /api/applications, whole result streamed in registry order
+    if format not in service.EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(service.EXPORT_FORMATS)}")
+    stmt = service.applications_export_query(q, statuses, date_from, date_to, search)
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"applications_{datetime.utcnow():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(_export_chunks(stmt, format), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 @app.get("/api/applications/{app_id}", response_model=schemas.ApplicationOut)
-def applications_get(app_id: UUID, db: Session = Depends(get_db)):
-    row = service.get_application_bundle(db, app_id)
+async def applications_get(app_id: UUID, read: Reader = Depends(get_reader)):
+    row = await read(service.get_application_view, app_id)
     if not row: raise ValueError("Application not found")
     return row
 
@@ -292,6 +465,15 @@ def applications_ensure_card(app_id: UUID, db: Session = Depends(get_db)):
     c = service.ensure_card_for_application(db, app_id)
     return schemas.CardEnsureOut(card_id=c.id, card_no=c.card_no)
 
+# Bulk intake
+@app.post("/api/intake/applications", response_model=dict)
+async def applications_intake(request: Request, format: str | None = None, by: str | None = None,
+                              db: Session = Depends(get_db)):
+    # body: NDJSON (one {..application fields, "client_id" | "client": {...}} per line) or CSV with client.* columns
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    body = await request.body()
+    return await run_in_threadpool(intake.intake_applications, db, body, fmt, by)
+
 # Print forms
 def _parse_iso_date(v: str | None) -> date | None:
     if not v:
@@ -303,67 +485,212 @@ def _parse_iso_date(v: str | None) -> date | None:
 
 
 def _normalize_client_for_print(client: dict) -> dict:
-    # In SQL we use row_to_json(c.*): dates come as ISO strings -> convert for templates.
+    # In SQL the client is to_jsonb(c.*): dates come as ISO strings -> convert for templates.
     out = dict(client or {})
     for k in ("birth_date", "doc_issue_date"):
         if isinstance(out.get(k), str):
             out[k] = _parse_iso_date(out.get(k))  # type: ignore[arg-type]
     return out
 
+PRINT_FORMS = {"statement": "application_statement.html", "contract": "contract_offer.html"}
+
+def _print_digest(app_id, template_name: str, stamp, refs_etag: str, staff_name: str | None, staff_position: str | None) -> str:
+    # everything the form renders from: application, client, directories, template, staff fields
+    return pdf_cache.make_key(app_id, template_name, pdf_renderer.template_hash(template_name),
+                              stamp["updated_at"], stamp["client_updated_at"], refs_etag,
+                              staff_name, staff_position)
+
+def _print_lookup(db: Session, app_id: UUID, template_name: str, staff_name: str | None, staff_position: str | None):
+    stamp = service.get_print_stamp(db, app_id)
+    if not stamp: raise ValueError("Application not found")
+    refs_etag = ref_cache.get(("meta",), lambda: _load_meta_refs(db))[1]
+    return stamp, _print_digest(app_id, template_name, stamp, refs_etag, staff_name, staff_position)
+
+def _bundle_context(row, staff_name: str | None, staff_position: str | None) -> dict:
+    row = dict(row)  # shipped to a renderer process: plain picklable types only
+    return {
+        "app": row, "client": _normalize_client_for_print(row["client"]), "product": row["product"], "tariff": row["tariff"],
+        "channel": row["channel"], "branch": row["branch"], "delivery": row["delivery"],
+        "staff_name": staff_name, "staff_position": staff_position,
+        "generated_at": datetime.utcnow(),
+    }
+
+def _print_context(db: Session, app_id: UUID, staff_name: str | None, staff_position: str | None) -> dict:
+    row = service.get_application_bundle(db, app_id)
+    if not row: raise ValueError("Application not found")
+    return _bundle_context(row, staff_name, staff_position)
+
+def _clean_staff(staff_name: str | None, staff_position: str | None):
+    return (staff_name.strip()[:120] if staff_name else None,
+            staff_position.strip()[:120] if staff_position else None)
+
+async def _print_form(request: Request, read: Reader, app_id: UUID, template_name: str, suffix: str,
+                      staff_name: str | None, staff_position: str | None):
+    # async so a print request waiting on the renderer pool does not hold an API threadpool slot;
+    # DB work goes through the reader, blocking disk work to the threadpool
+    staff_name, staff_position = _clean_staff(staff_name, staff_position)
+    stamp, digest = await read(_print_lookup, app_id, template_name, staff_name, staff_position)
+    headers = {
+        "Content-Disposition": f'inline; filename="{stamp["application_no"]}_{suffix}.pdf"',
+        "ETag": f'"{digest[:32]}"',
+        "Cache-Control": "no-cache",
+    }
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    pdf_bytes = await run_in_threadpool(pdf_cache.get, app_id, digest)
+    if pdf_bytes is None:
+        ctx = await read(_print_context, app_id, staff_name, staff_position)
+        pdf_bytes = await pdf_renderer.pool.render(template_name, ctx)
+        await run_in_threadpool(pdf_cache.put, app_id, digest, pdf_bytes)
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
 @app.get("/api/applications/{app_id}/print/statement")
-def print_statement(
+async def print_statement(
+    request: Request,
     app_id: UUID,
     staff_name: str | None = None,
     staff_position: str | None = None,
-    db: Session = Depends(get_db),
+    read: Reader = Depends(get_reader),
 ):
-    row = service.get_application_bundle(db, app_id)
-    if not row: raise ValueError("Application not found")
-    staff_name = staff_name.strip()[:120] if staff_name else None
-    staff_position = staff_position.strip()[:120] if staff_position else None
-    client = _normalize_client_for_print(row["client"])
-    pdf_bytes = pdf_renderer.render_pdf("application_statement.html", {
-        "app": row, "client": client, "product": row["product"], "tariff": row["tariff"],
-        "channel": row["channel"], "branch": row["branch"], "delivery": row["delivery"],
-        "staff_name": staff_name, "staff_position": staff_position,
-        "generated_at": datetime.utcnow(),
-    })
-    return StreamingResponse(iter([pdf_bytes]), media_type="application/pdf",
-                             headers={"Content-Disposition": f'inline; filename="{row["application_no"]}_statement.pdf"'})
+    return await _print_form(request, read, app_id, PRINT_FORMS["statement"], "statement", staff_name, staff_position)
 
 @app.get("/api/applications/{app_id}/print/contract")
-def print_contract(
+async def print_contract(
+    request: Request,
     app_id: UUID,
     staff_name: str | None = None,
     staff_position: str | None = None,
-    db: Session = Depends(get_db),
+    read: Reader = Depends(get_reader),
 ):
-    row = service.get_application_bundle(db, app_id)
-    if not row: raise ValueError("Application not found")
-    staff_name = staff_name.strip()[:120] if staff_name else None
-    staff_position = staff_position.strip()[:120] if staff_position else None
-    client = _normalize_client_for_print(row["client"])
-    pdf_bytes = pdf_renderer.render_pdf("contract_offer.html", {
-        "app": row, "client": client, "product": row["product"], "tariff": row["tariff"],
-        "channel": row["channel"], "branch": row["branch"], "delivery": row["delivery"],
-        "staff_name": staff_name, "staff_position": staff_position,
-        "generated_at": datetime.utcnow(),
-    })
-    return StreamingResponse(iter([pdf_bytes]), media_type="application/pdf",
-                             headers={"Content-Disposition": f'inline; filename="{row["application_no"]}_contract.pdf"'})
+    return await _print_form(request, read, app_id, PRINT_FORMS["contract"], "contract", staff_name, staff_position)
 
 # ------------------
 # Batches
 # ------------------
 
 @app.get("/api/batches")
-def batches_list(limit: int = 50, offset: int = 0, db: Session = Depends(get_db)):
-    total, rows = service.list_batches(db, limit, offset)
-    return _page(total, limit, offset, [dict(r) for r in rows])
+async def batches_list(limit: int = 50, offset: int = 0, cursor: str | None = None, count: str = "exact",
+                       read: Reader = Depends(get_reader)):
+    # pass cursor= (empty) to start keyset paging, then meta.next_cursor from each page
+    raw = settings.json_passthrough
+    total, rows, next_cursor = await read(service.list_batches, limit, offset, count=count, cursor=cursor, raw=raw)
+    if cursor is None:
+        return _list_page(total, limit, offset, rows, raw, count=count)
+    return _list_page(total, limit, 0, rows, raw, count=count, next_cursor=next_cursor)
+
+# Bulk print: every application of a batch in one response.
+# All DB work happens before streaming starts (the session is released once the endpoint returns);
+# renders then run a pool-sized window ahead of the writer, so memory holds only a few PDFs at a time.
+
+BULK_PRINT_FORMATS = ("pdf", "zip")
+
+class _ChunkSink(io.RawIOBase):
+    # unseekable write target: zipfile falls back to data descriptors and we drain it per entry
+    def __init__(self):
+        self._chunks: list[bytes] = []
+    def writable(self) -> bool:
+        return True
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _batch_print_jobs(db: Session, batch_id: UUID, forms: list[str], staff_name: str | None, staff_position: str | None):
+    batch_no, stamps = service.list_batch_print_stamps(db, batch_id)
+    if not stamps: raise ValueError("Batch has no applications")
+    refs_etag = ref_cache.get(("meta",), lambda: _load_meta_refs(db))[1]
+    bundles = service.get_application_bundles(db, [s["id"] for s in stamps])
+    jobs = []
+    for st in stamps:
+        ctx = _bundle_context(bundles[st["id"]], staff_name, staff_position)
+        for form in forms:
+            tpl = PRINT_FORMS[form]
+            jobs.append((st["id"], f'{st["application_no"]}_{form}.pdf', tpl, ctx,
+                         _print_digest(st["id"], tpl, st, refs_etag, staff_name, staff_position)))
+    return batch_no, jobs
+
+async def _bulk_render_one(app_id, template_name: str, ctx: dict, digest: str) -> bytes:
+    data = await run_in_threadpool(pdf_cache.get, app_id, digest)
+    if data is None:
+        data = await pdf_renderer.pool.render(template_name, ctx, admit=True)
+        await run_in_threadpool(pdf_cache.put, app_id, digest, data)
+    return data
+
+async def _bulk_rendered(jobs):
+    # yields (filename, pdf) in job order, keeping at most one render per pool worker in flight
+    window = max(1, pdf_renderer.pool.workers)
+    pending: deque = deque()
+    try:
+        for app_id, name, tpl, ctx, digest in jobs:
+            pending.append((name, asyncio.ensure_future(_bulk_render_one(app_id, tpl, ctx, digest))))
+            if len(pending) >= window:
+                name_, task = pending.popleft()
+                yield name_, await task
+        while pending:
+            name_, task = pending.popleft()
+            yield name_, await task
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+async def _stream_zip(jobs):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:  # PDFs are already compressed
+        async for name, data in _bulk_rendered(jobs):
+            zf.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
+
+async def _stream_merged_pdf(jobs):
+    # a merged PDF can only be written once every part is known: parts are spooled to disk past a
+    # few MB and the result is sent in chunks; the number of parts is capped by pdf_bulk_merge_max
+    parts = [data async for _, data in _bulk_rendered(jobs)]
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        await run_in_threadpool(pdf_renderer.merge_pdfs, parts, out)
+        del parts
+        out.seek(0)
+        while chunk := await run_in_threadpool(out.read, 256 * 1024):
+            yield chunk
+    finally:
+        out.close()
+
+@app.get("/api/batches/{batch_id}/print")
+async def batch_print(
+    batch_id: UUID,
+    forms: str = "statement,contract",
+    format: str = "pdf",
+    staff_name: str | None = None,
+    staff_position: str | None = None,
+    read: Reader = Depends(get_reader),
+):
+    form_list = [f.strip() for f in forms.split(",") if f.strip()]
+    if not form_list or any(f not in PRINT_FORMS for f in form_list):
+        raise ValueError(f"forms must be a comma-separated subset of: {', '.join(PRINT_FORMS)}")
+    if format not in BULK_PRINT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(BULK_PRINT_FORMATS)}")
+    staff_name, staff_position = _clean_staff(staff_name, staff_position)
+    batch_no, jobs = await read(_batch_print_jobs, batch_id, form_list, staff_name, staff_position)
+    if format == "pdf" and len(jobs) > settings.pdf_bulk_merge_max:
+        raise ValueError(f"Too many forms to merge ({len(jobs)} > {settings.pdf_bulk_merge_max}), use format=zip")
+    # fail with 503 now rather than mid-stream
+    pdf_renderer.pool.check_capacity()
+
+    if format == "zip":
+        body, media_type = _stream_zip(jobs), "application/zip"
+    else:
+        body, media_type = _stream_merged_pdf(jobs), "application/pdf"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{batch_no}_print.{format}"',
+    })
 
 @app.get("/api/batches/{batch_id}")
-def batch_get(batch_id: UUID, db: Session = Depends(get_db)):
-    b = service.get_batch_bundle(db, batch_id)
+async def batch_get(batch_id: UUID, read: Reader = Depends(get_reader)):
+    b = await read(service.get_batch_bundle, batch_id)
     if not b:
         raise ValueError("Batch not found")
     return b
@@ -384,8 +711,8 @@ def batches_create(data: schemas.BatchCreate, db: Session = Depends(get_db)):
 
 @app.post("/api/batches/{batch_id}/items", response_model=dict)
 def batches_add_items(batch_id: UUID, data: schemas.BatchAddItems, db: Session = Depends(get_db)):
-    service.add_batch_items(db, batch_id, data.application_ids)
-    return {"ok": True}
+    added = service.add_batch_items(db, batch_id, data.application_ids)
+    return {"ok": True, "added": added}
 
 @app.post("/api/batches/{batch_id}/status", response_model=dict)
 def batches_set_status(batch_id: UUID, status: str, db: Session = Depends(get_db)):
@@ -397,14 +724,18 @@ def batches_set_status(batch_id: UUID, status: str, db: Session = Depends(get_db
 # ------------------
 
 @app.get("/api/cards")
-def cards_list(limit: int = 50, offset: int = 0, db: Session = Depends(get_db)):
-    total, rows = service.list_cards(db, limit, offset)
-    return _page(total, limit, offset, [dict(r) for r in rows])
+async def cards_list(limit: int = 50, offset: int = 0, count: str = "exact", fields: str | None = None,
+                     read: Reader = Depends(get_reader)):
+    # fields=grid|compact or a comma list of card columns / "status|application|client|batch[.key]"
+    raw = settings.json_passthrough
+    picked = service.parse_fields(fields, service.CARD_FIELD_PRESETS)
+    total, rows = await read(service.list_cards, limit, offset, count=count, raw=raw, fields=picked)
+    return _list_page(total, limit, offset, rows, raw, count=count)
 
 
 @app.get("/api/cards/{card_id}")
-def cards_get(card_id: UUID, db: Session = Depends(get_db)):
-    row = service.get_card_bundle(db, card_id)
+async def cards_get(card_id: UUID, read: Reader = Depends(get_reader)):
+    row = await read(service.get_card_bundle, card_id)
     if not row:
         raise ValueError("Card not found")
     return row
@@ -424,43 +755,47 @@ def _default_range(days: int = 30):
     return df, dt
 
 @app.get("/api/reports/funnel", response_model=schemas.FunnelReportOut)
-def report_funnel(
+async def report_funnel(
     date_from: datetime | None = None,
     date_to: datetime | None = None,
-    db: Session = Depends(get_db),
+    source: str = "rollup",
+    read: Reader = Depends(get_reader),
 ):
     if not date_from or not date_to:
         date_from, date_to = _default_range(30)
-    return service.report_funnel(db, date_from, date_to)
+    return await read(service.report_funnel, date_from, date_to, source=source)
 
 @app.get("/api/reports/volume", response_model=schemas.VolumeReportOut)
-def report_volume(
+async def report_volume(
     date_from: datetime | None = None,
     date_to: datetime | None = None,
     bucket: str = "day",
-    db: Session = Depends(get_db),
+    source: str = "rollup",
+    read: Reader = Depends(get_reader),
 ):
     if not date_from or not date_to:
         date_from, date_to = _default_range(90)
-    return service.report_volume(db, date_from, date_to, bucket=bucket)
+    return await read(service.report_volume, date_from, date_to, bucket=bucket, source=source)
 
 @app.get("/api/reports/sla", response_model=schemas.SlaReportOut)
-def report_sla(
+async def report_sla(
     date_from: datetime | None = None,
     date_to: datetime | None = None,
     bucket: str = "month",
-    db: Session = Depends(get_db),
+    source: str = "rollup",
+    read: Reader = Depends(get_reader),
 ):
     if not date_from or not date_to:
         date_from, date_to = _default_range(180)
-    return service.report_sla(db, date_from, date_to, bucket=bucket)
+    return await read(service.report_sla, date_from, date_to, bucket=bucket, source=source)
 
 @app.get("/api/reports/reject-reasons", response_model=schemas.RejectReasonReportOut)
-def report_reject_reasons(
+async def report_reject_reasons(
     date_from: datetime | None = None,
     date_to: datetime | None = None,
-    db: Session = Depends(get_db),
+    source: str = "rollup",
+    read: Reader = Depends(get_reader),
 ):
     if not date_from or not date_to:
         date_from, date_to = _default_range(365)
-    return service.report_reject_reasons(db, date_from, date_to)
+    return await read(service.report_reject_reasons, date_from, date_to, source=source)
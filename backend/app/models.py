@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime, date
 from sqlalchemy import (
-    String, DateTime, Date, Boolean, ForeignKey, Numeric, Text, Integer, UniqueConstraint, Index
+    String, DateTime, Date, Boolean, ForeignKey, Numeric, Text, Integer, UniqueConstraint, Index, Computed, Float
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -111,6 +111,9 @@ class Client(Base):
     short_name: Mapped[str | None] = mapped_column(String(120), nullable=True)
 
     phone: Mapped[str | None] = mapped_column(String(40), nullable=True)
+    # search keys maintained by Postgres (see 0003_trgm_search)
+    phone_norm: Mapped[str | None] = mapped_column(
+        String(40), Computed("regexp_replace(phone, '\\D', '', 'g')", persisted=True), nullable=True)
     email: Mapped[str | None] = mapped_column(String(120), nullable=True)
 
     birth_date: Mapped[date | None] = mapped_column(Date, nullable=True)
@@ -119,6 +122,8 @@ class Client(Base):
 
     doc_type: Mapped[str | None] = mapped_column(String(40), nullable=True)
     doc_number: Mapped[str | None] = mapped_column(String(40), nullable=True)
+    doc_number_norm: Mapped[str | None] = mapped_column(
+        String(40), Computed("lower(regexp_replace(doc_number, '[^0-9A-Za-z]', '', 'g'))", persisted=True), nullable=True)
     doc_issue_date: Mapped[date | None] = mapped_column(Date, nullable=True)
     doc_issuer: Mapped[str | None] = mapped_column(String(200), nullable=True)
 
@@ -139,6 +144,9 @@ class Client(Base):
     __table_args__ = (
         Index("ix_client_name", "full_name"),
         Index("ix_client_doc", "doc_number"),
+        Index("ix_client_name_trgm", "full_name", postgresql_using="gin", postgresql_ops={"full_name": "gin_trgm_ops"}),
+        Index("ix_client_doc_norm_trgm", "doc_number_norm", postgresql_using="gin", postgresql_ops={"doc_number_norm": "gin_trgm_ops"}),
+        Index("ix_client_phone_norm_trgm", "phone_norm", postgresql_using="gin", postgresql_ops={"phone_norm": "gin_trgm_ops"}),
     )
 
 class CardApplication(Base):
@@ -194,6 +202,7 @@ class CardApplication(Base):
         Index("ix_app_status", "status_id"),
         Index("ix_app_client", "client_id"),
         Index("ix_app_no", "application_no"),
+        Index("ix_app_no_trgm", "application_no", postgresql_using="gin", postgresql_ops={"application_no": "gin_trgm_ops"}),
     )
 
 class IssueBatch(Base):
@@ -210,8 +219,18 @@ class IssueBatch(Base):
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    # maintained by the service write paths (reconcile: `python -m app.batch_counters`)
+    applications_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    cards_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    cards_issued_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    cards_activated_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
     items = relationship("IssueBatchItem", back_populates="batch")
 
+    __table_args__ = (
+        Index("ix_issue_batch_created_id", "created_at", "id"),
+    )
+
 class IssueBatchItem(Base):
     __tablename__ = "issue_batch_item"
     id = uuid_pk()
@@ -253,16 +272,19 @@ class Card(Base):
     )
 
 class StatusHistory(Base):
+    # monthly range partitions on changed_at (see 0005_status_history_partitions, app.history)
     __tablename__ = "status_history"
     id = uuid_pk()
     entity_type: Mapped[str] = mapped_column(String(20))
     entity_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True))
     status_id: Mapped[int] = mapped_column(ForeignKey("ref_status.id"))
-    changed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    changed_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
     changed_by: Mapped[str | None] = mapped_column(String(120), nullable=True)
 
     __table_args__ = (
         Index("ix_status_hist_entity", "entity_type", "entity_id", "changed_at"),
+        Index("ix_status_hist_changed_brin", "changed_at", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (changed_at)"},
     )
 
 class FeeOperation(Base):
@@ -279,3 +301,68 @@ class FeeOperation(Base):
     __table_args__ = (
         Index("ix_fee_app", "application_id", "occurred_at"),
     )
+
+# -----------------------
+# Reporting
+# -----------------------
+
+class ReportDaily(Base):
+    # Daily rollup maintained by app.rollup; metrics are keyed by the application's requested_at day.
+    __tablename__ = "report_daily"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    branch_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    product_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    channel_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    applications: Mapped[int] = mapped_column(Integer, default=0)
+    approved: Mapped[int] = mapped_column(Integer, default=0)
+    rejected: Mapped[int] = mapped_column(Integer, default=0)
+    issued: Mapped[int] = mapped_column(Integer, default=0)
+    handed: Mapped[int] = mapped_column(Integer, default=0)
+    activated: Mapped[int] = mapped_column(Integer, default=0)
+
+    # duration sums (seconds) and the number of rows each sum covers, for averages
+    decision_sec: Mapped[float] = mapped_column(Float, default=0)
+    decision_n: Mapped[int] = mapped_column(Integer, default=0)
+    issue_sec: Mapped[float] = mapped_column(Float, default=0)
+    issue_n: Mapped[int] = mapped_column(Integer, default=0)
+    delivery_sec: Mapped[float] = mapped_column(Float, default=0)
+    delivery_n: Mapped[int] = mapped_column(Integer, default=0)
+    activate_sec: Mapped[float] = mapped_column(Float, default=0)
+    activate_n: Mapped[int] = mapped_column(Integer, default=0)
+
+    rejected_by_reason: Mapped[dict] = mapped_column(JSONB, default=dict)  # {reject_reason_id | "none": count}
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# -----------------------
+# Read models
+# -----------------------
+
+class ApplicationView(Base):
+    # One row per application with the list/detail JSON documents prebuilt; maintained by
+    # service.refresh_app_view* on every write path (rebuild: `python -m app.read_model`).
+    __tablename__ = "application_view"
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("card_application.id", ondelete="CASCADE"), primary_key=True)
+
+    application_no: Mapped[str] = mapped_column(String(30))
+    client_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True))
+    requested_at: Mapped[datetime] = mapped_column(DateTime)
+    status_code: Mapped[str] = mapped_column(String(50))
+    client_full_name: Mapped[str] = mapped_column(Text)
+    product_name: Mapped[str] = mapped_column(Text)
+    branch_name: Mapped[str] = mapped_column(Text)
+    batch_no: Mapped[str | None] = mapped_column(String(30), nullable=True)
+    batch_status_code: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    card_no: Mapped[str | None] = mapped_column(String(30), nullable=True)
+    card_status_code: Mapped[str | None] = mapped_column(String(50), nullable=True)
+
+    list_doc: Mapped[dict] = mapped_column(JSONB)
+    detail_doc: Mapped[dict] = mapped_column(JSONB)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_app_view_requested", "requested_at", "id"),
+        Index("ix_app_view_status_requested", "status_code", "requested_at"),
+        Index("ix_app_view_client", "client_id"),
+        Index("ix_app_view_no_trgm", "application_no", postgresql_using="gin", postgresql_ops={"application_no": "gin_trgm_ops"}),
+    )
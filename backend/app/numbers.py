@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .cache import number_stats_cache
+from .core.config import settings
+from .utils import next_seq_block, utcnow
+
+# Business number allocator: reserves blocks of app_seq/batch_seq/card_seq values with one
+# nextval-over-generate_series round trip and hands them out in-process. Sequences are not
+# transactional, so a reserved value is never reused: values still buffered when a worker stops,
+# and values taken by a transaction that rolls back, become gaps in the numbering. Workers hold
+# separate blocks, so numbers are unique but not ordered by creation time across workers.
+
+# sequence -> (table, number column) for gap statistics
+SEQUENCES = {
+    "app_seq": ("card_application", "application_no"),
+    "batch_seq": ("issue_batch", "batch_no"),
+    "card_seq": ("card", "card_no"),
+}
+
+
+class NumberAllocator:
+    def __init__(self, block_size: int):
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._free: dict[str, deque[int]] = {name: deque() for name in SEQUENCES}
+        self._stats = {name: {"blocks": 0, "reserved": 0, "issued": 0} for name in SEQUENCES}
+
+    def take(self, db: Session, seq_name: str, n: int = 1) -> list[int]:
+        if n <= 0:
+            return []
+        with self._lock:
+            free = self._free[seq_name]
+            out = [free.popleft() for _ in range(min(n, len(free)))]
+        if len(out) < n:
+            # one round trip for the shortfall plus a fresh block; leftovers go back to the buffer
+            need = n - len(out)
+            values = next_seq_block(db, seq_name, need + self.block_size if self.block_size > 1 else need)
+            out += values[:need]
+            with self._lock:
+                st = self._stats[seq_name]
+                st["blocks"] += 1
+                st["reserved"] += len(values)
+                self._free[seq_name].extend(values[need:])
+        with self._lock:
+            self._stats[seq_name]["issued"] += len(out)
+        return out
+
+    def next(self, db: Session, seq_name: str) -> int:
+        return self.take(db, seq_name, 1)[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: {**st, "buffered": len(self._free[name]), "block_size": self.block_size}
+                    for name, st in self._stats.items()}
+
+
+allocator = NumberAllocator(settings.number_block_size)
+
+
+def _scan_numbers(db: Session, seq: str) -> dict:
+    # full scan of the number column: cached for number_stats_ttl_seconds
+    stats = number_stats_cache.get(seq)
+    if stats is None:
+        table, col = SEQUENCES[seq]
+        r = db.execute(text(f"""
+          SELECT count(*) AS used, min(n) AS min_no, max(n) AS max_no
+          FROM (SELECT substring({col} from '[0-9]+$')::bigint AS n FROM {table}) x
+        """)).one()
+        stats = {"used": r.used, "min_no": r.min_no, "max_no": r.max_no, "scanned_at": utcnow().isoformat()}
+        number_stats_cache.set(seq, stats)
+    return stats
+
+
+def gap_stats(db: Session) -> dict:
+    """Per sequence: numbers in use vs the span they cover, and how far the sequence ran ahead.
+
+    used/min_no/max_no/gaps come from a scan at most number_stats_ttl_seconds old (scanned_at);
+    sequence_last_value and the process counters are read on every call.
+    """
+    out = {}
+    for seq in SEQUENCES:
+        r = _scan_numbers(db, seq)
+        last = db.execute(text(f"SELECT CASE WHEN is_called THEN last_value END FROM {seq}")).scalar()
+        span = (r["max_no"] - r["min_no"] + 1) if r["used"] else 0
+        out[seq] = {
+            **r,
+            "gaps": span - r["used"],
+            "sequence_last_value": last,
+            # reserved by workers (or lost) beyond the highest number in use
+            "ahead": (last - (r["max_no"] or 0)) if last is not None else 0,
+        }
+    proc = allocator.stats()
+    for seq in out:
+        out[seq]["process"] = proc[seq]
+    return out
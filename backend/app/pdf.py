@@ -1,12 +1,257 @@
 from __future__ import annotations
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
 import os
+import threading
+import time
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterable
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from weasyprint import HTML
+from pypdf import PdfReader, PdfWriter
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from .core.config import settings
+
+log = logging.getLogger(__name__)
 
 TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+PRINT_TEMPLATES = ("application_statement.html", "contract_offer.html")
 env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(["html"]))
 
+# Parsed shared stylesheet + font configuration, built once per thread and reused by every render
+# (the templates no longer inline _base.css, so WeasyPrint does not re-parse it per document).
+_assets = threading.local()
+
+def _render_assets() -> tuple[CSS, FontConfiguration]:
+    if not hasattr(_assets, "css"):
+        fonts = FontConfiguration()
+        _assets.css = CSS(filename=os.path.join(TEMPLATE_DIR, "_base.css"), font_config=fonts)
+        _assets.fonts = fonts
+    return _assets.css, _assets.fonts
+
 def render_pdf(template_name: str, context: dict) -> bytes:
     tpl = env.get_template(template_name)
     html = tpl.render(**context)
-    return HTML(string=html, base_url=TEMPLATE_DIR).write_pdf()
+    css, fonts = _render_assets()
+    return HTML(string=html, base_url=TEMPLATE_DIR).write_pdf(stylesheets=[css], font_config=fonts)
+
+# a complete (made-up) print context: the forms read app.*, client.* and the directories, so
+# warming up with anything less fails in the template instead of loading fonts
+SAMPLE_CONTEXT = {
+    "app": {
+        "application_no": "APP-2000-000000", "requested_at": datetime(2000, 1, 1, 9, 0), "is_salary_project": False,
+        "priority": "normal", "embossing_name": "IVAN IVANOV", "limits_requested_json": {"atm_day": 50000},
+        "delivery_address": "г. Москва, ул. Тверская, д. 1", "requested_delivery_date": date(2000, 1, 10),
+        "delivery_comment": None, "planned_issue_date": date(2000, 1, 5), "comment": None,
+    },
+    "client": {
+        "full_name": "Иванов Иван Иванович", "birth_date": date(1980, 1, 1), "phone": "+7 900 000-00-00",
+        "email": "client@example.com", "doc_type": "паспорт", "doc_number": "4500 000000", "doc_issue_date": date(2000, 1, 1),
+        "doc_issuer": "ОУФМС", "reg_address": "г. Москва", "fact_address": None, "segment": "mass",
+        "kyc_status": "passed", "risk_level": "low",
+    },
+    "product": {"name": "Classic", "payment_system": "MIR", "level": "Classic", "currency": "RUB", "term_months": 48},
+    "tariff": {"name": "Base", "issue_fee": 0, "monthly_fee": 99, "free_condition_text": None,
+               "limits_json": {"purchases_month": 1000000}},
+    "channel": {"name": "Офис"},
+    "branch": {"name": "Главный офис", "city": "Москва", "address": "ул. Тверская, д. 1", "phone": "+7 495 000-00-00"},
+    "delivery": {"name": "В отделении"},
+    "staff_name": "Петров П. П.", "staff_position": "менеджер",
+    "generated_at": datetime(2000, 1, 1, 9, 0),
+}
+
+warmup_report: dict = {}
+
+def warm_up() -> dict:
+    # compile the print templates, parse the stylesheet, load fonts and lay out every form once;
+    # a second identical render shows what the first real print no longer pays
+    t0 = time.perf_counter()
+    _render_assets()
+    for name in PRINT_TEMPLATES:
+        render_pdf(name, SAMPLE_CONTEXT)
+    cold = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    render_pdf(PRINT_TEMPLATES[0], SAMPLE_CONTEXT)
+    warm = time.perf_counter() - t1
+    warmup_report.update(pid=os.getpid(), cold_ms=round(cold * 1000, 1), warm_ms=round(warm * 1000, 1),
+                         saved_ms=round((cold - warm) * 1000, 1))
+    return dict(warmup_report)
+
+_template_hashes: dict[str, str] = {}
+
+def template_hash(template_name: str) -> str:
+    # template + shared stylesheet; part of the print cache key so a deploy with new forms misses
+    h = _template_hashes.get(template_name)
+    if h is None:
+        sha = hashlib.sha256()
+        for name in (template_name, "_base.css"):
+            with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+                sha.update(f.read())
+        h = _template_hashes[template_name] = sha.hexdigest()[:16]
+    return h
+
+def merge_pdfs(parts: Iterable[bytes], out: BinaryIO) -> None:
+    writer = PdfWriter()
+    for data in parts:
+        writer.append(PdfReader(io.BytesIO(data)))
+    writer.write(out)
+
+# --------------------
+# Renderer pool
+# --------------------
+
+class RenderUnavailable(Exception):
+    # mapped to 503 + Retry-After by the API
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+WARMUP_TIMEOUT_SECONDS = 120
+
+_started = None  # set by RenderPool.start() once every worker has reported
+
+def _warm_up_report() -> dict:
+    # a failed warm-up is reported, not raised: raising in a worker initializer breaks the whole pool
+    try:
+        return warm_up()
+    except Exception as e:
+        log.exception("pdf renderer warm-up failed")
+        return {"pid": os.getpid(), "error": f"{type(e).__name__}: {e}"}
+
+def _init_worker(reports, started):
+    # once per process, before the first real job; the report goes straight back to RenderPool.start()
+    global _started
+    _started = started
+    reports.put(_warm_up_report())
+
+def _start_job() -> None:
+    # keeps its worker busy until all have reported, so each submit from start() spawns a new process
+    _started.wait(WARMUP_TIMEOUT_SECONDS)
+
+def _render_job(template_name: str, context: dict) -> tuple[bytes, float]:
+    t0 = time.perf_counter()
+    data = render_pdf(template_name, context)
+    return data, time.perf_counter() - t0
+
+
+class RenderPool:
+    """WeasyPrint in a dedicated process pool, so print load never occupies the API threadpool.
+
+    At most `workers` renders run at once and at most `queue_max` more wait; beyond that
+    submit() fails fast with RenderUnavailable instead of queueing unbounded work.
+    """
+
+    def __init__(self, workers: int, queue_max: int, timeout: float, retry_after: int):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._executor: ProcessPoolExecutor | None = None
+        self._reports = self._started = None  # worker warm-up reports / start() done, made with the executor
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.warmup: list[dict] = []
+        self.stats = {
+            "renders": 0, "failures": 0, "rejected": 0, "timeouts": 0,
+            "render_ms_total": 0.0, "render_ms_max": 0.0, "wait_ms_total": 0.0, "last_render_ms": None,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                ctx = multiprocessing.get_context("spawn")  # spawn: never fork the threaded API process
+                self._reports, self._started = ctx.Queue(), ctx.Event()
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                                     initializer=_init_worker, initargs=(self._reports, self._started))
+            return self._executor
+
+    def start(self) -> list[dict]:
+        """Start (and warm up) every renderer now rather than on the first print; returns the warm-up timings."""
+        if self.workers <= 0:
+            reports = [_warm_up_report()]
+        else:
+            ex = self._get_executor()
+            jobs = [ex.submit(_start_job) for _ in range(self.workers)]
+            try:
+                reports = [self._reports.get(timeout=WARMUP_TIMEOUT_SECONDS) for _ in range(self.workers)]
+            finally:
+                self._started.set()
+            for f in jobs:
+                f.result()
+        for r in reports:
+            if "error" in r:
+                log.warning("pdf renderer %s not warmed up: %s", r["pid"], r["error"])
+            else:
+                log.info("pdf renderer %s warmed up: first render %.0f ms, warm render %.0f ms (%.0f ms saved)",
+                         r["pid"], r["cold_ms"], r["warm_ms"], r["saved_ms"])
+        with self._lock:
+            self.warmup = reports
+        return reports
+
+    def shutdown(self) -> None:
+        with self._lock:
+            ex, self._executor = self._executor, None
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            out = dict(self.stats)
+            out.update({"workers": self.workers, "queue_max": self.queue_max, "in_flight": self._in_flight,
+                        "queued": max(0, self._in_flight - self.workers), "warmup": list(self.warmup)})
+        out["render_ms_avg"] = out["render_ms_total"] / out["renders"] if out["renders"] else None
+        return out
+
+    def check_capacity(self) -> None:
+        with self._lock:
+            if self.workers > 0 and self._in_flight >= self.workers + self.queue_max:
+                self.stats["rejected"] += 1
+                raise RenderUnavailable("PDF renderer is busy, retry later", self.retry_after)
+
+    async def render(self, template_name: str, context: dict, admit: bool = False) -> bytes:
+        # admit=True skips the queue cap: for callers that bound their own concurrency (bulk print)
+        # and can no longer turn a rejection into a 503 because the response has started
+        if self.workers <= 0:
+            # pool disabled: render inline on a threadpool thread (previous behaviour)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, render_pdf, template_name, context)
+
+        with self._lock:
+            if not admit and self._in_flight >= self.workers + self.queue_max:
+                self.stats["rejected"] += 1
+                raise RenderUnavailable("PDF renderer is busy, retry later", self.retry_after)
+            self._in_flight += 1
+        t0 = time.perf_counter()
+        try:
+            fut = asyncio.wrap_future(self._get_executor().submit(_render_job, template_name, context))
+            data, render_s = await asyncio.wait_for(fut, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise RenderUnavailable("PDF rendering timed out", self.retry_after) from None
+        except Exception:
+            with self._lock:
+                self.stats["failures"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        total_ms, render_ms = (time.perf_counter() - t0) * 1000, render_s * 1000
+        with self._lock:
+            st = self.stats
+            st["renders"] += 1
+            st["render_ms_total"] += render_ms
+            st["render_ms_max"] = max(st["render_ms_max"], render_ms)
+            st["wait_ms_total"] += max(0.0, total_ms - render_ms)
+            st["last_render_ms"] = render_ms
+        return data
+
+
+pool = RenderPool(settings.pdf_workers, settings.pdf_queue_max, settings.pdf_render_timeout_seconds,
+                  settings.pdf_retry_after_seconds)
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from .db import SessionLocal
+from .service import rebuild_app_view
+
+# Application read model (application_view): kept current by the service write paths; this rebuilds
+# every row from the live tables, e.g. after a migration or a data fix done directly in SQL.
+
+
+def main() -> None:
+    with SessionLocal() as db:
+        n = rebuild_app_view(db)
+    print(f"application_view: {n} rows rebuilt")
+
+
+if __name__ == "__main__":
+    main()
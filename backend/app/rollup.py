@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import argparse
+from datetime import date
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+from .db import SessionLocal
+
+# Daily report rollup: one report_daily row per (requested day, branch, product, channel).
+# Every metric is attributed to the application's requested_at day, exactly like the live reports,
+# so a write only ever touches the rows of the applications it changed.
+
+_AGG = """
+  SELECT day, branch_id, product_id, channel_id,
+    sum(applications) AS applications, sum(approved) AS approved, sum(rejected) AS rejected,
+    sum(issued) AS issued, sum(handed) AS handed, sum(activated) AS activated,
+    sum(decision_sec) AS decision_sec, sum(decision_n) AS decision_n,
+    sum(issue_sec) AS issue_sec, sum(issue_n) AS issue_n,
+    sum(delivery_sec) AS delivery_sec, sum(delivery_n) AS delivery_n,
+    sum(activate_sec) AS activate_sec, sum(activate_n) AS activate_n,
+    COALESCE(jsonb_object_agg(reason, rejected) FILTER (WHERE rejected > 0), '{{}}'::jsonb) AS rejected_by_reason
+  FROM (
+    SELECT a.requested_at::date AS day, a.branch_id, a.product_id, a.channel_id,
+      CASE WHEN s.code='REJECTED' THEN COALESCE(a.reject_reason_id::text, 'none') END AS reason,
+      count(*) AS applications,
+      count(*) FILTER (WHERE s.code IN ('APPROVED','IN_BATCH')) AS approved,
+      count(*) FILTER (WHERE s.code='REJECTED') AS rejected,
+      count(c.issued_at) AS issued,
+      count(c.handed_at) AS handed,
+      count(c.activated_at) AS activated,
+      COALESCE(sum(EXTRACT(EPOCH FROM (a.decision_at - a.requested_at))), 0) AS decision_sec,
+      count(a.decision_at) AS decision_n,
+      COALESCE(sum(EXTRACT(EPOCH FROM (c.issued_at - a.requested_at))), 0) AS issue_sec,
+      count(c.issued_at) AS issue_n,
+      COALESCE(sum(EXTRACT(EPOCH FROM (c.delivered_at - c.issued_at))), 0) AS delivery_sec,
+      count(c.delivered_at - c.issued_at) AS delivery_n,
+      COALESCE(sum(EXTRACT(EPOCH FROM (c.activated_at - c.handed_at))), 0) AS activate_sec,
+      count(c.activated_at - c.handed_at) AS activate_n
+    FROM card_application a
+    {keys_join}
+    JOIN ref_status s ON s.id=a.status_id
+    LEFT JOIN card c ON c.application_id=a.id
+    {where}
+    GROUP BY 1, 2, 3, 4, 5
+  ) g
+  GROUP BY 1, 2, 3, 4
+"""
+
+_COLS = ("applications, approved, rejected, issued, handed, activated, "
+         "decision_sec, decision_n, issue_sec, issue_n, delivery_sec, delivery_n, "
+         "activate_sec, activate_n, rejected_by_reason")
+
+_UPSERT = """
+  INSERT INTO report_daily (day, branch_id, product_id, channel_id, """ + _COLS + """, updated_at)
+  SELECT *, now() AT TIME ZONE 'utc' FROM ({agg}) x
+  ON CONFLICT (day, branch_id, product_id, channel_id) DO UPDATE SET
+  """ + ", ".join(f"{c} = EXCLUDED.{c}" for c in _COLS.split(", ")) + """, updated_at = EXCLUDED.updated_at
+"""
+
+_KEYS = """
+  WITH keys AS (
+    SELECT DISTINCT requested_at::date AS day, branch_id, product_id, channel_id
+    FROM card_application WHERE id = ANY(CAST(:ids AS uuid[]))
+    UNION
+    SELECT * FROM unnest(CAST(:days AS date[]), CAST(:branches AS int[]), CAST(:products AS int[]), CAST(:channels AS int[]))
+  )
+"""
+
+
+def app_key(a) -> tuple[date, int, int, int]:
+    # rollup key of an application as currently loaded (capture before edits that may move it)
+    return (a.requested_at.date(), a.branch_id, a.product_id, a.channel_id)
+
+
+def refresh(db: Session, app_ids: list[UUID] = (), keys: list[tuple] = ()) -> None:
+    """Recompute the rollup rows of the given applications (and extra keys) inside the caller's transaction."""
+    if not app_ids and not keys:
+        return
+    db.flush()
+    keys = list(keys)
+    params = {
+        "ids": list(app_ids),
+        "days": [k[0] for k in keys], "branches": [k[1] for k in keys],
+        "products": [k[2] for k in keys], "channels": [k[3] for k in keys],
+    }
+    # one writer per key at a time: the lock is held to commit, so the statements below (new snapshots)
+    # see whatever an earlier writer of the same key committed; sorted to avoid lock-order deadlocks
+    db.execute(text(_KEYS + """
+      SELECT pg_advisory_xact_lock(hashtext('report_daily'), h)
+      FROM (SELECT DISTINCT hashtext(concat_ws('/', day, branch_id, product_id, channel_id)) AS h FROM keys ORDER BY h) x
+    """), params)
+    # groups that became empty must disappear; the upsert recreates the others
+    db.execute(text(_KEYS + """
+      DELETE FROM report_daily r USING keys k
+      WHERE r.day=k.day AND r.branch_id=k.branch_id AND r.product_id=k.product_id AND r.channel_id=k.channel_id
+    """), params)
+    agg = _AGG.format(
+        keys_join="""JOIN keys k ON a.requested_at >= k.day AND a.requested_at < k.day + 1
+          AND a.branch_id=k.branch_id AND a.product_id=k.product_id AND a.channel_id=k.channel_id""",
+        where="",
+    )
+    db.execute(text(_KEYS + _UPSERT.format(agg=agg)), params)
+
+
+def rebuild(db: Session, date_from: date | None = None, date_to: date | None = None) -> int:
+    """Backfill: recompute every rollup row with day in [date_from, date_to] (open-ended when None)."""
+    params = {"df": date_from, "dt": date_to}
+    cond = "(CAST(:df AS date) IS NULL OR {c} >= CAST(:df AS date)) AND (CAST(:dt AS date) IS NULL OR {c} <= CAST(:dt AS date))"
+    db.execute(text("DELETE FROM report_daily WHERE " + cond.format(c="day")), params)
+    agg = _AGG.format(keys_join="", where="WHERE " + cond.format(c="a.requested_at::date"))
+    n = db.execute(text(_UPSERT.format(agg=agg)), params).rowcount
+    db.commit()
+    return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the report_daily rollup table.")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, default=None)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        n = rebuild(db, args.date_from, args.date_to)
+    print(f"report_daily: {n} rows rebuilt")
+
+
+if __name__ == "__main__":
+    main()
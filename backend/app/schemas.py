@@ -2,12 +2,18 @@ from __future__ import annotations
 from datetime import datetime, date
 from uuid import UUID
 import re
-from pydantic import BaseModel, Field, ConfigDict, field_validator, ValidationInfo
+from pydantic import BaseModel, Field, ConfigDict, field_validator, model_validator, ValidationInfo
 
 # ---------- Common ----------
 
+def rows_out(schema: type[BaseModel], rows) -> list[dict]:
+    # read side: the schema's fields straight off ORM rows (validated when written),
+    # without building and re-validating a model instance per row
+    fields = tuple(schema.model_fields)
+    return [{f: getattr(r, f) for f in fields} for r in rows]
+
 class PageMeta(BaseModel):
-    total: int
+    total: int | None  # None when requested with count=none
     limit: int
     offset: int
 
@@ -155,6 +161,17 @@ class ApplicationCreate(BaseModel):
 class ApplicationUpdate(ApplicationCreate):
     pass
 
+class ApplicationIntakeRow(ApplicationCreate):
+    # bulk intake: an existing client_id, or a new client created with the application
+    client_id: UUID | None = None
+    client: ClientCreate | None = None
+
+    @model_validator(mode="after")
+    def _one_client(self):
+        if (self.client_id is None) == (self.client is None):
+            raise ValueError("exactly one of client_id / client is required")
+        return self
+
 class ApplicationDecisionIn(BaseModel):
     decision: str  # approve/reject
     reject_reason_id: int | None = None
@@ -10,7 +10,8 @@ from typing import Iterable
 from sqlalchemy.orm import Session
 
 from .db import SessionLocal
-from . import models
+from . import models, rollup, history, service
+from .cache import status_resolver
 
 _RU2EN = {
     "а":"a","б":"b","в":"v","г":"g","д":"d","е":"e","ё":"e","ж":"zh","з":"z","и":"i","й":"y","к":"k","л":"l","м":"m",
@@ -27,12 +28,7 @@ def _count(db: Session, model) -> int:
 
 
 def _get_status_id(db: Session, entity_type: str, code: str) -> int:
-    s = (
-        db.query(models.RefStatus)
-        .filter(models.RefStatus.entity_type == entity_type, models.RefStatus.code == code)
-        .one()
-    )
-    return int(s.id)
+    return status_resolver.id(db, entity_type, code)
 
 
 def _ensure_statuses(db: Session) -> None:
@@ -65,6 +61,7 @@ def _ensure_statuses(db: Session) -> None:
         else:
             db.add(models.RefStatus(entity_type=entity_type, code=code, name=name, sort_order=sort_order))
     db.commit()
+    status_resolver.invalidate()
 
 
 def _ensure_reject_reasons(db: Session) -> None:
@@ -266,10 +263,10 @@ def _address(city: str) -> str:
     return f"{city}, {prefix} {street}, д. {random.randint(1, 220)}, кв. {random.randint(1, 180)}"
 
 
-def _ensure_clients(db: Session, target: int = 18) -> None:
+def _ensure_clients(db: Session, target: int = 18) -> bool:
     cur = _count(db, models.Client)
     if cur >= target:
-        return
+        return False
 
     last_names_m = ["Иванов", "Петров", "Сидоров", "Морозов", "Кузнецов", "Орлов", "Глазунов", "Смирнов", "Волков", "Егоров"]
     last_names_f = ["Иванова", "Петрова", "Сидорова", "Морозова", "Кузнецова", "Орлова", "Глазунова", "Смирнова", "Волкова", "Егорова"]
@@ -325,9 +322,10 @@ def _ensure_clients(db: Session, target: int = 18) -> None:
         db.add(c)
 
     db.commit()
+    return True
 
 
-def _backfill_clients_profile(db: Session) -> None:
+def _backfill_clients_profile(db: Session) -> bool:
     cities = ["Москва", "Санкт-Петербург", "Екатеринбург", "Новосибирск", "Казань", "Нижний Новгород", "Пермь", "Самара"]
 
     used_emails = set(e for (e,) in db.query(models.Client.email).filter(models.Client.email.isnot(None)).all() if e)
@@ -362,12 +360,13 @@ def _backfill_clients_profile(db: Session) -> None:
 
     if changed:
         db.commit()
+    return changed
 
 
-def _ensure_applications(db: Session, target: int = 60) -> None:
+def _ensure_applications(db: Session, target: int = 60) -> bool:
     cur = _count(db, models.CardApplication)
     if cur >= target:
-        return
+        return False
 
     clients = db.query(models.Client).all()
     products = db.query(models.RefCardProduct).all()
@@ -378,7 +377,7 @@ def _ensure_applications(db: Session, target: int = 60) -> None:
     reject_reasons = db.query(models.RefRejectReason).all()
 
     if not (clients and products and tariffs and channels and branches and delivery):
-        return
+        return False
 
     year = datetime.utcnow().year
     start_seq = cur + 1
@@ -453,18 +452,21 @@ def _ensure_applications(db: Session, target: int = 60) -> None:
         db.add(app)
 
     db.commit()
+    return True
 
 
-def _ensure_batches_and_cards(db: Session, batches_target: int = 4) -> None:
+def _ensure_batches_and_cards(db: Session, batches_target: int = 4) -> bool:
     # Ensure batches
     batches = db.query(models.IssueBatch).all()
     vendors = db.query(models.RefVendor).all()
     year = datetime.utcnow().year
+    changed = False
 
     if not vendors:
-        return
+        return False
 
     if len(batches) < batches_target:
+        changed = True
         start_seq = len(batches) + 1
         for i in range(batches_target - len(batches)):
             vendor = random.choice(vendors)
@@ -521,6 +523,7 @@ def _ensure_batches_and_cards(db: Session, batches_target: int = 4) -> None:
             )
             a.status_id = in_batch_id
             db.add(it)
+            changed = True
         used += per_batch
         if used >= take:
             break
@@ -592,8 +595,10 @@ def _ensure_batches_and_cards(db: Session, batches_target: int = 4) -> None:
             note=random.choice([None, "Без пин-конверта", "Доставка в офис", ""]),
         )
         db.add(c)
+        changed = True
 
     db.commit()
+    return changed
 
 
 def seed() -> None:
@@ -608,11 +613,21 @@ def seed() -> None:
         _ensure_products(db)
         _ensure_tariffs(db)
 
-        _ensure_clients(db, target=25)
-        _backfill_clients_profile(db)
-
-        _ensure_applications(db, target=80)
-        _ensure_batches_and_cards(db, batches_target=7)
+        changed = _ensure_clients(db, target=25)
+        changed |= _backfill_clients_profile(db)
+
+        changed |= _ensure_applications(db, target=80)
+        changed |= _ensure_batches_and_cards(db, batches_target=7)
+
+        # runs on every container start: rebuild only after seeding wrote rows (seed writes bypass the
+        # service layer); otherwise full rebuilds are left to python -m app.rollup / app.read_model /
+        # app.batch_counters, since they lock and rewrite every application
+        if changed:
+            rollup.rebuild(db)
+            service.rebuild_app_view(db)
+            service.reconcile_batch_counters(db)
+            # backdated history lands in the default partition: give those months their own partitions
+            history.ensure_partitions(db)
 
 
 if __name__ == "__main__":
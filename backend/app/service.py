@@ -1,30 +1,145 @@
 from __future__ import annotations
-from datetime import datetime
-from uuid import UUID
+import re
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from uuid import UUID, uuid4
 from sqlalchemy.orm import Session
-from sqlalchemy import select, text, bindparam, or_
-from . import models
-from .utils import utcnow, next_seq, make_no
+from sqlalchemy import select, insert, text, bindparam, cast, func, String, DateTime
+from sqlalchemy.orm import aliased
+from . import models, rollup, schemas
+from .utils import utcnow, make_no, encode_cursor, decode_cursor
+from .numbers import allocator
+from .cache import status_resolver, count_cache, pdf_cache
 
 # --------------------
 # Helpers
 # --------------------
 
 def get_status_id(db: Session, entity_type: str, code: str) -> int:
-    s = db.execute(
-        select(models.RefStatus).where(models.RefStatus.entity_type == entity_type, models.RefStatus.code == code)
-    ).scalar_one()
-    return s.id
+    return status_resolver.id(db, entity_type, code)
+
+def get_status_code(db: Session, status_id: int) -> str:
+    return status_resolver.code(db, status_id)
 
 def add_history(db: Session, entity_type: str, entity_id: UUID, status_id: int, by: str | None = None):
     db.add(models.StatusHistory(entity_type=entity_type, entity_id=entity_id, status_id=status_id,
                                changed_at=utcnow(), changed_by=by))
 
+def add_history_many(db: Session, entity_type: str, entity_ids: list[UUID], status_id: int,
+                     by: str | None = None, at: datetime | None = None):
+    # one multi-row INSERT instead of an ORM object per entity
+    if not entity_ids:
+        return
+    at = at or utcnow()
+    db.execute(insert(models.StatusHistory), [
+        {"id": uuid4(), "entity_type": entity_type, "entity_id": eid, "status_id": status_id,
+         "changed_at": at, "changed_by": by}
+        for eid in entity_ids
+    ])
+
+def insert_with_history(db: Session, model, entity_type: str, values: dict, by: str | None = None, at: datetime | None = None):
+    """INSERT the entity RETURNING its row, plus its first status_history row, as one statement.
+
+    Replaces add -> commit -> refresh -> add_history -> commit: one round trip, and the history row
+    commits or fails together with the entity. Returns the inserted row (attribute access like the model).
+    """
+    t = model.__table__
+    at = at or utcnow()
+    ins = insert(t).values(id=uuid4(), **values).returning(*t.c).cte("ins")
+    hist = insert(models.StatusHistory.__table__).from_select(
+        ["id", "entity_type", "entity_id", "status_id", "changed_at", "changed_by"],
+        select(func.gen_random_uuid(), cast(entity_type, String), ins.c.id, ins.c.status_id,
+               cast(at, DateTime), cast(by, String)),
+    ).cte("hist")
+    return db.execute(select(ins).add_cte(hist)).one()
+
 def set_status(db: Session, entity_type: str, entity_id: UUID, status_code: str, by: str | None = None) -> int:
     sid = get_status_id(db, entity_type, status_code)
     add_history(db, entity_type, entity_id, sid, by)
     return sid
 
+COUNT_MODES = ("exact", "estimate", "none")
+
+class Total(NamedTuple):
+    value: int | None
+    # "exact": counted now; "cached": an exact count from the last count_cache_ttl_seconds;
+    # "estimate": planner row estimate (never cached); None: count=none
+    source: str | None
+
+def count_total(db: Session, name: str, from_where: str, params: dict, mode: str = "exact",
+                expanding: tuple[str, ...] = ()) -> Total:
+    # exact: count(*) (also refreshes the cache); estimate: cached exact total or planner row estimate; none: skip
+    if mode not in COUNT_MODES:
+        raise ValueError("count must be one of: " + ", ".join(COUNT_MODES))
+    if mode == "none":
+        return Total(None, None)
+
+    key = (name, from_where, tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in params.items())))
+    if mode == "estimate":
+        cached = count_cache.get(key)
+        if cached is not None:
+            return Total(cached, "cached")
+        stmt = text("EXPLAIN (FORMAT JSON) SELECT 1 " + from_where)
+    else:
+        stmt = text("SELECT count(*) " + from_where)
+    for p in expanding:
+        stmt = stmt.bindparams(bindparam(p, expanding=True))
+
+    if mode == "estimate":
+        # only exact counts go into count_cache, so a later estimate never reads back as a count
+        plan = db.execute(stmt, params).scalar_one()
+        return Total(int(plan[0]["Plan"]["Plan Rows"]), "estimate")
+    total = int(db.execute(stmt, params).scalar_one())
+    count_cache.set(key, total)
+    return Total(total, "exact")
+
+def json_rows_sql(sql: str, order_by: str, *keys: str) -> str:
+    """Wrap a page query so each row comes back as its JSON text (same keys as the row mapping).
+
+    JSON passthrough: the endpoint splices the texts into the response body without decoding them.
+    `keys` are extra columns kept alongside (e.g. for the next keyset cursor).
+    """
+    extra = "".join(f", q.{k}" for k in keys)
+    return f"SELECT to_json(q)::text AS doc{extra} FROM ({sql}) q ORDER BY {order_by}"
+
+# Sparse fieldsets (fields= on list endpoints): top-level keys and "object.key" paths checked against a
+# whitelist, or preset names. Only the requested values are built, and only the joins they need.
+
+def parse_fields(fields: str | None, presets: dict[str, tuple[str, ...]]) -> list[str] | None:
+    if not fields or not fields.strip():
+        return None
+    out: list[str] = []
+    for f in fields.split(","):
+        f = f.strip()
+        out += presets.get(f, (f,) if f else ())
+    return list(dict.fromkeys(out))
+
+def sparse_doc_sql(paths: list[str], resolve, present: dict[str, str]) -> tuple[str, set[str]]:
+    """jsonb_build_object over the requested paths, and the top-level keys it touches.
+
+    resolve(path) -> SQL expression, or None when the path is not whitelisted.
+    present: {object key: SQL condition}, nullable objects built from picked keys stay null when absent.
+    """
+    picked: dict[str, list[str] | None] = {}  # key -> picked sub-keys, None = the whole value
+    for p in paths:
+        if resolve(p) is None:
+            raise ValueError(f"Unknown field: {p}")
+        head, _, sub = p.partition(".")
+        if not sub:
+            picked[head] = None
+        elif picked.setdefault(head, []) is not None:
+            picked[head].append(sub)
+    pairs = []
+    for head, subs in picked.items():
+        if subs is None:
+            expr = resolve(head)
+        else:
+            expr = "jsonb_build_object(" + ", ".join(f"'{k}', {resolve(head + '.' + k)}" for k in subs) + ")"
+            if head in present:
+                expr = f"CASE WHEN {present[head]} THEN {expr} END"
+        pairs.append(f"'{head}', {expr}")
+    return "jsonb_build_object(" + ", ".join(pairs) + ")", set(picked)
+
 def fetch_ref_map(db: Session):
     # Often needed for UI dropdowns.
     return {
@@ -58,39 +173,73 @@ def update_client(db: Session, client_id: UUID, data) -> models.Client:
     for k, v in data.model_dump().items():
         setattr(c, k, v)
     c.updated_at = utcnow()
+    refresh_app_view_where(db, "a.client_id = :view_client", {"view_client": client_id})
     db.commit()
     db.refresh(c)
     return c
 
-def list_clients(db: Session, q: str | None, limit: int, offset: int):
-    stmt = select(models.Client)
-    if q:
-        like = f"%{q.strip()}%"
-        stmt = stmt.where(or_(models.Client.full_name.ilike(like), models.Client.doc_number.ilike(like)))
-    total = db.execute(select(text("count(*)")).select_from(stmt.subquery())).scalar_one()
-    items = db.execute(stmt.order_by(models.Client.created_at.desc()).limit(limit).offset(offset)).scalars().all()
+SEARCH_MODES = ("contains", "ranked")
+
+def _norm_doc(v: str) -> str:
+    # must match the client.doc_number_norm generated column
+    return re.sub(r"[^0-9A-Za-z]", "", v).lower()
+
+def _client_match(alias: str, q: str, params: dict, search: str, rank_alias: str | None = None) -> tuple[str, str]:
+    """WHERE condition and rank expression for a client search; every branch is served by a trigram index.
+
+    The condition reads client columns through `alias`, the rank through `rank_alias` (default: the same),
+    for callers that filter in a subquery but rank in the outer query.
+    """
+    if search not in SEARCH_MODES:
+        raise ValueError("search must be one of: " + ", ".join(SEARCH_MODES))
+    ra = rank_alias or alias
+    q = q.strip()
+    norm, digits = _norm_doc(q), re.sub(r"\D", "", q)
+    params.update({"q": f"%{q}%", "qs": q})
+    conds = [f"{alias}.full_name ILIKE :q"]
+    rank = f"similarity({ra}.full_name, :qs)"
+    if len(norm) >= 3:
+        params.update({"qn": f"%{norm}%", "qn_eq": norm})
+        conds.append(f"{alias}.doc_number_norm LIKE :qn")
+        rank += f" + CASE WHEN {ra}.doc_number_norm = :qn_eq THEN 2 ELSE 0 END"
+    if len(digits) >= 3:
+        params.update({"qp": f"%{digits}%", "qp_eq": digits})
+        conds.append(f"{alias}.phone_norm LIKE :qp")
+        rank += f" + CASE WHEN {ra}.phone_norm = :qp_eq THEN 2 ELSE 0 END"
+    if search == "ranked":
+        # fuzzy name match (pg_trgm similarity threshold) on top of substring matches
+        conds.append(f"{alias}.full_name % :qs")
+    return "(" + " OR ".join(conds) + ")", rank
+
+def list_clients(db: Session, q: str | None, limit: int, offset: int, count: str = "exact", search: str = "contains"):
+    c = aliased(models.Client, name="c")
+    stmt = select(c)
+    from_where, params = "FROM client c", {}
+    order = [c.created_at.desc()]
+    if q and q.strip():
+        cond, rank = _client_match("c", q, params, search)
+        stmt = stmt.where(text(cond))
+        from_where += " WHERE " + cond
+        if search == "ranked":
+            order = [text(f"({rank}) DESC")] + order
+    total = count_total(db, "clients", from_where, params, count)
+    items = db.execute(stmt.order_by(*order).limit(limit).offset(offset), params).scalars().all()
     return total, items
 
 # --------------------
 # Applications
 # --------------------
 
-def create_application(db: Session, data, by: str | None = None) -> models.CardApplication:
-    year = utcnow().year
-    seq = next_seq(db, "app_seq")
-    app_no = make_no("APP", year, seq, 6)
-
+def create_application(db: Session, data, by: str | None = None):
+    now = utcnow()
+    app_no = make_no("APP", now.year, allocator.next(db, "app_seq"), 6)
     sid = get_status_id(db, "application", "NEW")
-    a = models.CardApplication(**data.model_dump(), application_no=app_no, status_id=sid)
-    a.requested_at = utcnow()
-    a.created_at = utcnow()
-    a.updated_at = utcnow()
-
-    db.add(a)
-    db.commit()
-    db.refresh(a)
-
-    add_history(db, "application", a.id, sid, by)
+    a = insert_with_history(db, models.CardApplication, "application", {
+        **data.model_dump(), "application_no": app_no, "status_id": sid,
+        "requested_at": now, "created_at": now, "updated_at": now,
+    }, by, now)
+    rollup.refresh(db, [a.id])
+    refresh_app_view(db, [a.id])
     db.commit()
     return a
 
@@ -100,15 +249,18 @@ def update_application(db: Session, app_id: UUID, data, by: str | None = None) -
         raise ValueError("Application not found")
 
     # protect fields if already decided
-    status = db.get(models.RefStatus, a.status_id)
-    if status.code in {"APPROVED", "REJECTED", "IN_BATCH"}:
+    if get_status_code(db, a.status_id) in {"APPROVED", "REJECTED", "IN_BATCH"}:
         raise ValueError("Application is already in a final or processing state. Editing is restricted.")
 
+    old_key = rollup.app_key(a)
     for k, v in data.model_dump().items():
         setattr(a, k, v)
     a.updated_at = utcnow()
+    rollup.refresh(db, [a.id], keys=[old_key])
+    refresh_app_view(db, [a.id])
     db.commit()
     db.refresh(a)
+    pdf_cache.invalidate(a.id)
     return a
 
 def decide_application(db: Session, app_id: UUID, data, by: str | None = None) -> models.CardApplication:
@@ -116,7 +268,7 @@ def decide_application(db: Session, app_id: UUID, data, by: str | None = None) -
     if not a:
         raise ValueError("Application not found")
 
-    cur = db.get(models.RefStatus, a.status_id).code
+    cur = get_status_code(db, a.status_id)
     if cur not in {"NEW", "IN_REVIEW"}:
         raise ValueError(f"Decision is not allowed from status {cur}")
 
@@ -140,17 +292,19 @@ def decide_application(db: Session, app_id: UUID, data, by: str | None = None) -
         raise ValueError("decision must be 'approve' or 'reject'")
 
     a.updated_at = now
+    rollup.refresh(db, [a.id])
+    refresh_app_view(db, [a.id])
     db.commit()
     db.refresh(a)
+    pdf_cache.invalidate(a.id)
     return a
 
 
-def get_application_bundle(db: Session, app_id: UUID):
-    # heavy view for UI (detail)
-    q = text("""
+# heavy view for UI (detail) and print forms
+_BUNDLE_SQL = """
       SELECT
         a.*,
-        row_to_json(c.*) AS client,
+        to_jsonb(c.*) - 'doc_number_norm' - 'phone_norm' AS client,  -- generated search columns stay internal
         row_to_json(p.*) AS product,
         row_to_json(t.*) AS tariff,
         jsonb_build_object('id', ch.id, 'code', ch.code, 'name', ch.name, 'is_active', ch.is_active) AS channel,
@@ -182,24 +336,47 @@ def get_application_bundle(db: Session, app_id: UUID):
       LEFT JOIN ref_status bs ON bs.id=bat.status_id
       LEFT JOIN card cd ON cd.application_id=a.id
       LEFT JOIN ref_status cs ON cs.id=cd.status_id
+"""
+
+def get_application_bundle(db: Session, app_id: UUID):
+    return db.execute(text(_BUNDLE_SQL + " WHERE a.id=:app_id"), {"app_id": app_id}).mappings().one_or_none()
+
+
+def get_application_bundles(db: Session, app_ids: list[UUID]) -> dict:
+    # bulk print: every bundle in one query instead of one per application
+    if not app_ids:
+        return {}
+    rows = db.execute(text(_BUNDLE_SQL + " WHERE a.id = ANY(CAST(:ids AS uuid[]))"), {"ids": list(app_ids)}).mappings().all()
+    return {r["id"]: r for r in rows}
+
+
+def get_print_stamp(db: Session, app_id: UUID):
+    # cheap version check for cached print forms (the bundle is only loaded on a cache miss)
+    return db.execute(text("""
+      SELECT a.application_no, a.updated_at, c.updated_at AS client_updated_at
+      FROM card_application a
+      JOIN client c ON c.id=a.client_id
       WHERE a.id=:app_id
-    """)
-    row = db.execute(q, {"app_id": app_id}).mappings().one_or_none()
-    return row
+    """), {"app_id": app_id}).mappings().one_or_none()
 
 
+def list_batch_print_stamps(db: Session, batch_id: UUID):
+    # print stamps of every application in a batch, in application number order
+    b = db.execute(text("SELECT batch_no FROM issue_batch WHERE id=:id"), {"id": batch_id}).one_or_none()
+    if not b:
+        raise ValueError("Batch not found")
+    rows = db.execute(text("""
+      SELECT a.id, a.application_no, a.updated_at, c.updated_at AS client_updated_at
+      FROM issue_batch_item bi
+      JOIN card_application a ON a.id=bi.application_id
+      JOIN client c ON c.id=a.client_id
+      WHERE bi.batch_id=:id
+      ORDER BY a.application_no
+    """), {"id": batch_id}).mappings().all()
+    return b.batch_no, rows
 
 
-def list_applications_view(
-    db: Session,
-    q: str | None,
-    status_codes: list[str] | None,
-    date_from: datetime | None,
-    date_to: datetime | None,
-    limit: int,
-    offset: int,
-):
-    base = """
+_APP_LIST_FROM = """
       FROM card_application a
       JOIN client c ON c.id=a.client_id
       JOIN ref_card_product p ON p.id=a.product_id
@@ -216,37 +393,14 @@ def list_applications_view(
       LEFT JOIN ref_status cs ON cs.id=cd.status_id
     """
 
-    where = " WHERE 1=1"
-    params: dict = {}
-
-    if q:
-        params["q"] = f"%{q.strip()}%"
-        where += " AND (a.application_no ILIKE :q OR c.full_name ILIKE :q OR c.doc_number ILIKE :q)"
-
-    if status_codes:
-        params["sc"] = status_codes
-        # IMPORTANT: with text() we must use expanding bindparam for IN
-        where += " AND s.code IN :sc"
-
-    if date_from:
-        params["df"] = date_from
-        where += " AND a.requested_at >= :df"
-
-    if date_to:
-        params["dt"] = date_to
-        where += " AND a.requested_at < :dt"
-
-    count_stmt = text("SELECT count(*) " + base + where)
-
-    sql = """
-      SELECT
+_APP_LIST_COLUMNS = """
         a.id, a.application_no, a.requested_at, a.planned_issue_date, a.requested_delivery_date,
         a.priority, a.is_salary_project, a.embossing_name,
         a.delivery_address, a.delivery_comment,
         a.kyc_score, a.kyc_result, a.decision_at, a.decision_by,
         a.reject_reason_id,
         a.comment, a.created_at, a.updated_at,
-        row_to_json(c.*) AS client,
+        to_jsonb(c.*) - 'doc_number_norm' - 'phone_norm' AS client,  -- generated search columns stay internal
         row_to_json(p.*) AS product,
         row_to_json(t.*) AS tariff,
         row_to_json(ch.*) AS channel,
@@ -274,71 +428,383 @@ def list_applications_view(
           'activated_at', cd.activated_at,
           'status', jsonb_build_object('id', cs.id, 'entity_type', cs.entity_type, 'code', cs.code, 'name', cs.name)
         ) END) AS card
-      """ + base + where + """
-      ORDER BY a.requested_at DESC
-      LIMIT :limit OFFSET :offset
-    """
+"""
 
-    data_stmt = text(sql)
-    params.update({"limit": limit, "offset": offset})
+_APP_ORDER = "a.requested_at DESC, a.id DESC"
+
+def _application_filters(params: dict, q: str | None, status_codes: list[str] | None,
+                         date_from: datetime | None, date_to: datetime | None, search: str,
+                         status_col: str = "s.code") -> tuple[str, str]:
+    # registry filters shared by the list view and the export: (WHERE clause, ORDER BY)
+    where = " WHERE 1=1"
+    order_by = _APP_ORDER
+    if q and q.strip():
+        # client match as a semi-join so both sides of the OR can use their own trigram index
+        # the rank reads the client joined as c in the outer query
+        cond, rank = _client_match("cc", q, params, search, rank_alias="c")
+        where += f" AND (a.application_no ILIKE :q OR a.client_id IN (SELECT cc.id FROM client cc WHERE {cond}))"
+        if search == "ranked":
+            order_by = f"(CASE WHEN a.application_no ILIKE :q THEN 3 ELSE 0 END + {rank}) DESC, " + order_by
+
+    if status_codes:
+        params["sc"] = status_codes
+        # IMPORTANT: with text() we must use expanding bindparam for IN
+        where += f" AND {status_col} IN :sc"
+
+    if date_from:
+        params["df"] = date_from
+        where += " AND a.requested_at >= :df"
+
+    if date_to:
+        params["dt"] = date_to
+        where += " AND a.requested_at < :dt"
+    return where, order_by
+
+
+# fields= for /api/applications, read from the application_view document (flat columns where there is one)
+def _table_cols(model) -> tuple[str, ...]:
+    return tuple(model.__table__.c.keys())
+
+_STATUS_KEYS = ("id", "entity_type", "code", "name")
+APP_FIELDS: dict[str, tuple[str, ...]] = {
+    **{k: () for k in ("id", "application_no", "requested_at", "planned_issue_date", "requested_delivery_date",
+                       "priority", "is_salary_project", "embossing_name", "delivery_address", "delivery_comment",
+                       "kyc_score", "kyc_result", "decision_at", "decision_by", "reject_reason_id",
+                       "comment", "created_at", "updated_at")},
+    "client": tuple(schemas.ClientOut.model_fields),  # public client fields, not the search columns
+    "product": _table_cols(models.RefCardProduct),
+    "tariff": _table_cols(models.RefTariffPlan),
+    "channel": _table_cols(models.RefChannel),
+    "branch": _table_cols(models.RefBranch),
+    "delivery_method": _table_cols(models.RefDeliveryMethod),
+    "status": _STATUS_KEYS,
+    "reject_reason": ("id", "code", "name"),
+    "batch": ("id", "batch_no", "planned_send_at", "sent_at", "received_at", "status"),
+    "card": ("id", "card_no", "pan_masked", "expiry_month", "expiry_year",
+             "issued_at", "delivered_at", "handed_at", "activated_at", "status"),
+}
+_APP_FLAT_FIELDS = {
+    "id": "a.id", "application_no": "a.application_no", "requested_at": "a.requested_at",
+    "status.code": "a.status_code", "client.id": "a.client_id", "client.full_name": "a.client_full_name",
+    "product.name": "a.product_name", "branch.name": "a.branch_name",
+    "batch.batch_no": "a.batch_no", "card.card_no": "a.card_no",
+}
+_APP_FIELDS_PRESENT = {k: f"jsonb_typeof(a.list_doc->'{k}') = 'object'" for k in ("reject_reason", "batch", "card")}
+APP_FIELD_PRESETS = {
+    # the applications grid
+    "grid": ("id", "application_no", "requested_at", "planned_issue_date", "status.code", "status.name",
+             "client.id", "client.full_name", "client.phone", "client.doc_number",
+             "product.name", "product.payment_system", "product.level", "product.currency",
+             "tariff.name", "tariff.issue_fee", "tariff.monthly_fee", "branch.name", "branch.city"),
+    # pickers and lookups
+    "compact": ("id", "application_no", "requested_at", "status.code", "client.full_name",
+                "product.name", "branch.name", "batch.batch_no", "card.card_no"),
+}
+
+def _app_field(path: str) -> str | None:
+    if path in _APP_FLAT_FIELDS:
+        return _APP_FLAT_FIELDS[path]
+    head, _, sub = path.partition(".")
+    if head not in APP_FIELDS or (sub and sub not in APP_FIELDS[head]):
+        return None
+    return f"a.list_doc #> '{{{head},{sub}}}'" if sub else f"a.list_doc->'{head}'"
+
+def list_applications_view(
+    db: Session,
+    q: str | None,
+    status_codes: list[str] | None,
+    date_from: datetime | None,
+    date_to: datetime | None,
+    limit: int,
+    offset: int,
+    cursor: str | None = None,
+    count: str = "exact",
+    search: str = "contains",
+    raw: bool = False,
+    fields: list[str] | None = None,
+):
+    # served from the application_view read model: one indexed table, documents prebuilt at write time
+    # raw=True returns each document as JSON text (passthrough) instead of a decoded dict
+    # fields (see APP_FIELDS / APP_FIELD_PRESETS) trims each document to the requested paths
+    # cursor=None -> LIMIT/OFFSET; cursor="" -> first keyset page; otherwise continue after (requested_at, id)
+    base = " FROM application_view a"
+    params: dict = {}
+    where, order_by = _application_filters(params, q, status_codes, date_from, date_to, search, status_col="a.status_code")
+    if order_by != _APP_ORDER:
+        if cursor is not None:
+            raise ValueError("search=ranked cannot be combined with cursor pagination")
+        base += " JOIN client c ON c.id=a.client_id"  # rank reads the client's search columns
+
+    count_params = dict(params)
+
+    page_where = where
+    if cursor:
+        ca, cid = decode_cursor(cursor, 2)
+        try:
+            params["c_at"], params["c_id"] = datetime.fromisoformat(ca), UUID(cid)
+        except ValueError:
+            raise ValueError("Invalid cursor") from None
+        page_where += " AND (a.requested_at, a.id) < (:c_at, :c_id)"
+
+    doc = sparse_doc_sql(fields, _app_field, _APP_FIELDS_PRESENT)[0] if fields else "a.list_doc"
+    doc = (f"({doc})::text" if raw else doc) + " AS list_doc"
+    data_stmt = text("SELECT a.id, a.requested_at, " + doc + base + page_where
+                     + " ORDER BY " + order_by + " LIMIT :limit OFFSET :offset")
+    keyset = cursor is not None
+    # keyset pages fetch one extra row to know whether there is a next page
+    params.update({"limit": limit + 1 if keyset else limit, "offset": 0 if keyset else offset})
 
     if "sc" in params:
-        count_stmt = count_stmt.bindparams(bindparam("sc", expanding=True))
         data_stmt = data_stmt.bindparams(bindparam("sc", expanding=True))
 
-    total = db.execute(count_stmt, params).scalar_one()
-    rows = db.execute(data_stmt, params).mappings().all()
-    return total, rows
+    total = count_total(db, "applications", base + where, count_params, count,
+                        expanding=("sc",) if "sc" in params else ())
+    rows = db.execute(data_stmt, params).all()
+    next_cursor = None
+    if keyset and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].requested_at, rows[-1].id)
+    return total, [r.list_doc for r in rows], next_cursor
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# flat registry columns for spreadsheets: (output name, SQL expression)
+EXPORT_COLUMNS = (
+    ("application_no", "a.application_no"),
+    ("requested_at", "a.requested_at"),
+    ("status", "s.code"),
+    ("status_name", "s.name"),
+    ("client_name", "c.full_name"),
+    ("client_phone", "c.phone"),
+    ("client_doc_number", "c.doc_number"),
+    ("product", "p.name"),
+    ("tariff", "t.name"),
+    ("channel", "ch.name"),
+    ("branch", "b.name"),
+    ("delivery_method", "d.name"),
+    ("priority", "a.priority"),
+    ("is_salary_project", "a.is_salary_project"),
+    ("embossing_name", "a.embossing_name"),
+    ("delivery_address", "a.delivery_address"),
+    ("planned_issue_date", "a.planned_issue_date"),
+    ("decision_at", "a.decision_at"),
+    ("decision_by", "a.decision_by"),
+    ("reject_reason", "rr.name"),
+    ("batch_no", "bat.batch_no"),
+    ("batch_status", "bs.code"),
+    ("card_no", "cd.card_no"),
+    ("card_status", "cs.code"),
+    ("created_at", "a.created_at"),
+    ("updated_at", "a.updated_at"),
+)
+
+def applications_export_query(q: str | None, status_codes: list[str] | None, date_from: datetime | None,
+                              date_to: datetime | None, search: str = "contains"):
+    # built up front so bad filters fail before the response starts streaming
+    params: dict = {}
+    where, order_by = _application_filters(params, q, status_codes, date_from, date_to, search)
+    cols = ", ".join(f"{expr} AS {name}" for name, expr in EXPORT_COLUMNS)
+    stmt = text(f"SELECT {cols} {_APP_LIST_FROM} {where} ORDER BY {order_by}")
+    if "sc" in params:
+        stmt = stmt.bindparams(bindparam("sc", expanding=True))
+    return stmt.bindparams(**params)
+
+
+def iter_applications_export(db: Session, stmt, batch_size: int = 2000):
+    # server-side cursor: rows arrive batch_size at a time, memory stays flat whatever the result size
+    result = db.execute(stmt, execution_options={"yield_per": batch_size})
+    yield from result.mappings().partitions()
 
 # --------------------
-# Batches
+# Application read model
 # --------------------
+# application_view: one row per application with the list and detail documents prebuilt from the
+# same joins the live queries use, plus flat columns for filtering and sorting. Every write path that
+# changes something an application row shows refreshes the affected rows in its own transaction.
+
+_APP_VIEW_COLS = ("application_no, client_id, requested_at, status_code, client_full_name, product_name, branch_name, "
+                  "batch_no, batch_status_code, card_no, card_status_code, list_doc, detail_doc")
+
+_APP_VIEW_UPSERT = """
+  INSERT INTO application_view (id, """ + _APP_VIEW_COLS + """, updated_at)
+  SELECT l.id, l.application_no, d.client_id, l.requested_at, l.status->>'code', l.client->>'full_name',
+    l.product->>'name', l.branch->>'name', l.batch->>'batch_no', l.batch->'status'->>'code',
+    l.card->>'card_no', l.card->'status'->>'code', to_jsonb(l), to_jsonb(d), now() AT TIME ZONE 'utc'
+  FROM (SELECT {list_cols} {list_from} WHERE {cond}) l
+  JOIN ({detail} WHERE {cond}) d ON d.id = l.id
+  ON CONFLICT (id) DO UPDATE SET
+  """ + ", ".join(f"{c} = EXCLUDED.{c}" for c in _APP_VIEW_COLS.split(", ")) + """, updated_at = EXCLUDED.updated_at
+"""
+
+def refresh_app_view_where(db: Session, cond: str, params: dict | None = None) -> int:
+    """Recompute the read-model rows of the applications matching `cond` (SQL over alias a).
+
+    The applications are row-locked first: concurrent refreshes of one application then run one after
+    the other, and the upsert (a new statement snapshot) sees everything the earlier writer committed.
+    """
+    db.flush()
+    db.execute(text(f"SELECT a.id FROM card_application a WHERE {cond} ORDER BY a.id FOR UPDATE"), params or {})
+    return db.execute(text(_APP_VIEW_UPSERT.format(list_cols=_APP_LIST_COLUMNS, list_from=_APP_LIST_FROM,
+                                             detail=_BUNDLE_SQL, cond=cond)), params or {}).rowcount
 
-def create_batch(db: Session, data, by: str | None = None) -> models.IssueBatch:
-    year = utcnow().year
-    seq = next_seq(db, "batch_seq")
-    batch_no = make_no("BAT", year, seq, 6)
+def refresh_app_view(db: Session, app_ids: list[UUID]) -> None:
+    if app_ids:
+        refresh_app_view_where(db, "a.id = ANY(CAST(:view_ids AS uuid[]))", {"view_ids": list(app_ids)})
 
-    sid = get_status_id(db, "batch", "CREATED")
-    b = models.IssueBatch(
-        batch_no=batch_no,
-        vendor_id=data.vendor_id,
-        status_id=sid,
-        planned_send_at=data.planned_send_at,
-        created_at=utcnow(),
-    )
-    db.add(b)
+def refresh_app_view_for_batch(db: Session, batch_id: UUID) -> None:
+    refresh_app_view_where(db, "a.id IN (SELECT application_id FROM issue_batch_item WHERE batch_id=:view_batch)",
+                           {"view_batch": batch_id})
+
+# directory -> card_application column, for refreshing after a directory entry changes
+APP_VIEW_REFS = {"branch": "branch_id", "channel": "channel_id", "delivery": "delivery_method_id",
+                 "product": "product_id", "tariff": "tariff_id", "reject_reason": "reject_reason_id"}
+
+def refresh_app_view_for_ref(db: Session, ref: str, ref_id: int) -> None:
+    refresh_app_view_where(db, f"a.{APP_VIEW_REFS[ref]} = :view_ref", {"view_ref": ref_id})
+
+def rebuild_app_view(db: Session) -> int:
+    n = refresh_app_view_where(db, "TRUE")
     db.commit()
-    db.refresh(b)
+    return n
 
-    add_history(db, "batch", b.id, sid, by)
+def get_application_view(db: Session, app_id: UUID):
+    # detail document from the read model; falls back to the live joins for a row not built yet
+    doc = db.execute(text("SELECT detail_doc FROM application_view WHERE id=:id"), {"id": app_id}).scalar_one_or_none()
+    return doc if doc is not None else get_application_bundle(db, app_id)
+
+# --------------------
+# Batches
+# --------------------
+
+class BatchItemsRejected(ValueError):
+    def __init__(self, rejected: list[dict]):
+        super().__init__(f"{len(rejected)} application(s) cannot be added to the batch; nothing was added")
+        self.rejected = rejected
+
+
+# issue_batch counters (applications, cards, cards in ISSUED / ACTIVATED). Writers apply deltas: subtract
+# the affected applications' contribution before the change and add it back after, so concurrent writes
+# to one batch serialize on its row instead of overwriting each other's totals.
+# `python -m app.batch_counters` reconciles them with the base tables.
+
+_BATCH_COUNTERS = """
+  UPDATE issue_batch b SET
+    applications_count = b.applications_count + :sign * x.apps,
+    cards_count = b.cards_count + :sign * x.cards,
+    cards_issued_count = b.cards_issued_count + :sign * x.issued,
+    cards_activated_count = b.cards_activated_count + :sign * x.activated
+  FROM (
+    SELECT bi.batch_id, count(*) AS apps, count(cd.id) AS cards,
+      count(*) FILTER (WHERE cs.code='ISSUED') AS issued,
+      count(*) FILTER (WHERE cs.code='ACTIVATED') AS activated
+    FROM issue_batch_item bi
+    LEFT JOIN card cd ON cd.application_id=bi.application_id
+    LEFT JOIN ref_status cs ON cs.id=cd.status_id
+    WHERE {cond}
+    GROUP BY bi.batch_id
+  ) x
+  WHERE b.id=x.batch_id
+"""
+
+def _batch_counters(db: Session, sign: int, app_ids: list[UUID] | None = None, batch_id: UUID | None = None) -> None:
+    # +1 / -1 times the contribution of the given applications (or of a whole batch) to their batch counters
+    db.flush()
+    if batch_id is not None:
+        cond, params = "bi.batch_id=:cnt_batch", {"cnt_batch": batch_id}
+    elif app_ids:
+        cond, params = "bi.application_id = ANY(CAST(:cnt_ids AS uuid[]))", {"cnt_ids": list(app_ids)}
+    else:
+        return
+    db.execute(text(_BATCH_COUNTERS.format(cond=cond)), {"sign": sign, **params})
+
+def reconcile_batch_counters(db: Session) -> int:
+    """Recompute every batch's counters from the base tables; returns how many had drifted."""
+    n = db.execute(text("""
+      UPDATE issue_batch b SET
+        applications_count = x.apps, cards_count = x.cards,
+        cards_issued_count = x.issued, cards_activated_count = x.activated
+      FROM (
+        SELECT b2.id, count(bi.id) AS apps, count(cd.id) AS cards,
+          count(*) FILTER (WHERE cs.code='ISSUED') AS issued,
+          count(*) FILTER (WHERE cs.code='ACTIVATED') AS activated
+        FROM issue_batch b2
+        LEFT JOIN issue_batch_item bi ON bi.batch_id=b2.id
+        LEFT JOIN card cd ON cd.application_id=bi.application_id
+        LEFT JOIN ref_status cs ON cs.id=cd.status_id
+        GROUP BY b2.id
+      ) x
+      WHERE b.id=x.id
+        AND (b.applications_count, b.cards_count, b.cards_issued_count, b.cards_activated_count)
+            IS DISTINCT FROM (x.apps, x.cards, x.issued, x.activated)
+    """)).rowcount
+    db.commit()
+    return n
+
+def create_batch(db: Session, data, by: str | None = None):
+    now = utcnow()
+    batch_no = make_no("BAT", now.year, allocator.next(db, "batch_seq"), 6)
+    sid = get_status_id(db, "batch", "CREATED")
+    b = insert_with_history(db, models.IssueBatch, "batch", {
+        "batch_no": batch_no, "vendor_id": data.vendor_id, "status_id": sid,
+        "planned_send_at": data.planned_send_at, "created_at": now,
+    }, by, now)
     db.commit()
     return b
 
-def add_batch_items(db: Session, batch_id: UUID, application_ids: list[UUID], by: str | None = None):
-    batch = db.get(models.IssueBatch, batch_id)
-    if not batch:
+def add_batch_items(db: Session, batch_id: UUID, application_ids: list[UUID], by: str | None = None) -> int:
+    # All-or-nothing: validate every id first, then move the whole set with one statement.
+    if not db.execute(text("SELECT 1 FROM issue_batch WHERE id=:bid"), {"bid": batch_id}).first():
         raise ValueError("Batch not found")
 
+    ids = list(dict.fromkeys(application_ids))
+    if not ids:
+        return 0
+
     approved_id = get_status_id(db, "application", "APPROVED")
     in_batch_id = get_status_id(db, "application", "IN_BATCH")
 
-    for aid in application_ids:
-        a = db.get(models.CardApplication, aid)
-        if not a:
-            raise ValueError(f"Application {aid} not found")
-        if a.status_id != approved_id:
-            raise ValueError(f"Application {a.application_no} must be APPROVED to be added to batch")
-
-        # add item (unique constraint on application_id prevents duplicates)
-        db.add(models.IssueBatchItem(batch_id=batch_id, application_id=aid))
-
-        # move application to IN_BATCH
-        a.status_id = in_batch_id
-        a.updated_at = utcnow()
-        add_history(db, "application", a.id, in_batch_id, by)
-
+    found = db.execute(text("""
+      SELECT a.id, a.application_no, a.status_id, bi.batch_id
+      FROM card_application a
+      LEFT JOIN issue_batch_item bi ON bi.application_id=a.id
+      WHERE a.id = ANY(CAST(:ids AS uuid[]))
+      FOR UPDATE OF a
+    """), {"ids": ids}).all()
+    by_id = {r.id: r for r in found}
+
+    rejected = []
+    for aid in ids:
+        r = by_id.get(aid)
+        if r is None:
+            rejected.append({"id": str(aid), "application_no": None, "reason": "not found"})
+        elif r.batch_id is not None:
+            rejected.append({"id": str(aid), "application_no": r.application_no, "reason": "already in a batch"})
+        elif r.status_id != approved_id:
+            rejected.append({"id": str(aid), "application_no": r.application_no,
+                             "reason": f"status is {get_status_code(db, r.status_id)}, must be APPROVED"})
+    if rejected:
+        db.rollback()
+        raise BatchItemsRejected(rejected)
+
+    moved = db.execute(text("""
+      WITH moved AS (
+        UPDATE card_application SET status_id=:in_batch, updated_at=:now
+        WHERE id = ANY(CAST(:ids AS uuid[])) AND status_id=:approved
+        RETURNING id
+      ), items AS (
+        INSERT INTO issue_batch_item (id, batch_id, application_id)
+        SELECT gen_random_uuid(), :bid, id FROM moved
+        RETURNING application_id
+      )
+      INSERT INTO status_history (id, entity_type, entity_id, status_id, changed_at, changed_by)
+      SELECT gen_random_uuid(), 'application', application_id, :in_batch, :now, :by FROM items
+      RETURNING entity_id
+    """), {"ids": ids, "bid": batch_id, "approved": approved_id, "in_batch": in_batch_id,
+           "now": utcnow(), "by": by}).scalars().all()
+    _batch_counters(db, +1, app_ids=moved)
+    refresh_app_view(db, moved)
     db.commit()
+    return len(moved)
 
 def set_batch_status(db: Session, batch_id: UUID, status_code: str, by: str | None = None):
     b = db.get(models.IssueBatch, batch_id)
@@ -352,6 +818,7 @@ def set_batch_status(db: Session, batch_id: UUID, status_code: str, by: str | No
         b.received_at = now
 
     b.status_id = set_status(db, "batch", b.id, status_code, by)
+    refresh_app_view_for_batch(db, b.id)
     db.commit()
     db.refresh(b)
     if status_code == "RECEIVED":
@@ -369,6 +836,7 @@ def update_batch(db: Session, batch_id: UUID, data, by: str | None = None) -> mo
         # allow explicit null
         b.planned_send_at = data.planned_send_at
     b.updated_at = utcnow()
+    refresh_app_view_for_batch(db, b.id)
     db.commit()
     db.refresh(b)
     return b
@@ -394,7 +862,7 @@ def get_batch_bundle(db: Session, batch_id: UUID):
         i.id,
         row_to_json(a.*) AS application,
         jsonb_build_object('id', st.id, 'code', st.code, 'name', st.name, 'is_active', true) AS app_status,
-        row_to_json(c.*) AS client,
+        to_jsonb(c.*) - 'doc_number_norm' - 'phone_norm' AS client,  -- generated search columns stay internal
         CASE WHEN cd.id IS NULL THEN NULL ELSE jsonb_build_object(
           'id', cd.id, 'card_no', cd.card_no,
           'status', jsonb_build_object('id', cs.id, 'code', cs.code, 'name', cs.name, 'is_active', true),
@@ -415,19 +883,64 @@ def get_batch_bundle(db: Session, batch_id: UUID):
 
 
 def issue_batch_cards(db: Session, batch_id: UUID, by: str | None = None) -> dict:
-    # Create cards for all applications in the batch and move them to ISSUED
-    ids = db.execute(text("SELECT application_id FROM issue_batch_item WHERE batch_id=:bid"), {"bid": batch_id}).scalars().all()
-    issued = 0
-    created = 0
-    for app_id in ids:
-        card = ensure_card_for_application(db, app_id, by=by)
-        # if already issued or later - skip
-        cur_code = db.get(models.RefStatus, card.status_id).code
-        if cur_code == "CREATED":
-            card_event(db, card.id, "issued", by=by)
-            issued += 1
-        created += 1
-    return {"applications": len(ids), "cards_total": created, "cards_issued_now": issued}
+    # Create cards for all applications in the batch and move them to ISSUED.
+    # Set-based: one transaction, one sequence call, multi-row inserts for cards and history.
+    if not db.execute(text("SELECT 1 FROM issue_batch WHERE id=:bid FOR UPDATE"), {"bid": batch_id}).first():
+        raise ValueError("Batch not found")
+
+    rows = db.execute(text("""
+      SELECT i.application_id, a.application_no, a.status_id, cd.id AS card_id
+      FROM issue_batch_item i
+      JOIN card_application a ON a.id=i.application_id
+      LEFT JOIN card cd ON cd.application_id=i.application_id
+      WHERE i.batch_id=:bid
+    """), {"bid": batch_id}).all()
+
+    allowed = {get_status_id(db, "application", "APPROVED"), get_status_id(db, "application", "IN_BATCH")}
+    bad = [r.application_no for r in rows if r.card_id is None and r.status_id not in allowed]
+    if bad:
+        raise ValueError("Card can be created only for APPROVED/IN_BATCH applications: " + ", ".join(bad))
+
+    now = utcnow()
+    c_created = get_status_id(db, "card", "CREATED")
+    c_issued = get_status_id(db, "card", "ISSUED")
+    _batch_counters(db, -1, batch_id=batch_id)
+
+    # new cards go straight to ISSUED; history keeps both steps
+    missing = [r.application_id for r in rows if r.card_id is None]
+    seqs = allocator.take(db, "card_seq", len(missing))
+    new_cards = [
+        {"id": uuid4(), "card_no": make_no("CARD", now.year, n, 6), "application_id": aid,
+         "status_id": c_issued, "pan_masked": demo_pan_masked(n),
+         "expiry_month": 12, "expiry_year": now.year + 3, "issued_at": now}
+        for aid, n in zip(missing, seqs)
+    ]
+    if new_cards:
+        db.execute(insert(models.Card), new_cards)
+    new_ids = [c["id"] for c in new_cards]
+
+    # existing cards still in CREATED
+    promoted = db.execute(text("""
+      UPDATE card cd SET
+        status_id=:issued,
+        issued_at=:now,
+        pan_masked=COALESCE(cd.pan_masked, '**** **** **** ' || (1000 + split_part(cd.card_no, '-', 3)::bigint % 9000)::text),
+        expiry_month=COALESCE(cd.expiry_month, 12),
+        expiry_year=COALESCE(cd.expiry_year, :ey)
+      FROM issue_batch_item i
+      WHERE i.batch_id=:bid AND cd.application_id=i.application_id AND cd.status_id=:created
+      RETURNING cd.id
+    """), {"issued": c_issued, "created": c_created, "now": now, "ey": now.year + 3, "bid": batch_id}).scalars().all()
+
+    # CREATED one microsecond before ISSUED (= issued_at), so ordering by changed_at keeps the steps in order
+    add_history_many(db, "card", new_ids, c_created, by, at=now - timedelta(microseconds=1))
+    add_history_many(db, "card", new_ids + list(promoted), c_issued, by, at=now)
+    if new_ids or promoted:
+        rollup.refresh(db, [r.application_id for r in rows])
+    _batch_counters(db, +1, batch_id=batch_id)
+    refresh_app_view_for_batch(db, batch_id)
+    db.commit()
+    return {"applications": len(rows), "cards_total": len(rows), "cards_issued_now": len(new_ids) + len(promoted)}
 
 
 def get_card_bundle(db: Session, card_id: UUID):
@@ -449,31 +962,41 @@ def get_card_bundle(db: Session, card_id: UUID):
     return db.execute(q, {"cid": card_id}).mappings().one_or_none()
 
 
-def list_batches(db: Session, limit: int, offset: int):
-    total = db.execute(text("SELECT count(*) FROM issue_batch")).scalar_one()
-    sql = text("""
+def list_batches(db: Session, limit: int, offset: int, count: str = "exact", cursor: str | None = None, raw: bool = False):
+    # counters are columns of issue_batch (maintained on write), so a page costs O(page size)
+    # cursor=None -> LIMIT/OFFSET; cursor="" -> first keyset page; otherwise continue after (created_at, id)
+    total = count_total(db, "batches", "FROM issue_batch", {}, count)
+    params: dict = {}
+    where = ""
+    if cursor:
+        ca, cid = decode_cursor(cursor, 2)
+        try:
+            params["c_at"], params["c_id"] = datetime.fromisoformat(ca), UUID(cid)
+        except ValueError:
+            raise ValueError("Invalid cursor") from None
+        where = "WHERE (b.created_at, b.id) < (:c_at, :c_id)"
+    keyset = cursor is not None
+    params.update({"limit": limit + 1 if keyset else limit, "offset": 0 if keyset else offset})
+    sql = f"""
       SELECT
         b.*,
         jsonb_build_object('id', v.id, 'vendor_type', v.vendor_type, 'name', v.name, 'contacts', v.contacts, 'sla_days', v.sla_days, 'is_active', v.is_active) AS vendor,
-        jsonb_build_object('id', s.id, 'code', s.code, 'name', s.name, 'is_active', true) AS status,
-        (SELECT count(*) FROM issue_batch_item i WHERE i.batch_id=b.id) AS applications_count,
-        (SELECT count(*) FROM issue_batch_item i JOIN card cd ON cd.application_id=i.application_id WHERE i.batch_id=b.id) AS cards_count,
-        (SELECT count(*) FROM issue_batch_item i
-           JOIN card cd ON cd.application_id=i.application_id
-           JOIN ref_status cs ON cs.id=cd.status_id
-         WHERE i.batch_id=b.id AND cs.code='ISSUED') AS cards_issued_count,
-        (SELECT count(*) FROM issue_batch_item i
-           JOIN card cd ON cd.application_id=i.application_id
-           JOIN ref_status cs ON cs.id=cd.status_id
-         WHERE i.batch_id=b.id AND cs.code='ACTIVATED') AS cards_activated_count
+        jsonb_build_object('id', s.id, 'code', s.code, 'name', s.name, 'is_active', true) AS status
       FROM issue_batch b
       JOIN ref_vendor v ON v.id=b.vendor_id
       JOIN ref_status s ON s.id=b.status_id
-      ORDER BY b.created_at DESC
+      {where}
+      ORDER BY b.created_at DESC, b.id DESC
       LIMIT :limit OFFSET :offset
-    """)
-    rows = db.execute(sql, {"limit": limit, "offset": offset}).mappings().all()
-    return total, rows
+    """
+    if raw:
+        sql = json_rows_sql(sql, "q.created_at DESC, q.id DESC", "created_at", "id")
+    rows = db.execute(text(sql), params).mappings().all()
+    next_cursor = None
+    if keyset and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return total, [r["doc"] for r in rows] if raw else rows, next_cursor
 
 # --------------------
 # Cards
@@ -488,12 +1011,16 @@ CARD_ALLOWED = {
     "CLOSED": set(),
 }
 
-def ensure_card_for_application(db: Session, app_id: UUID, by: str | None = None) -> models.Card:
+def demo_pan_masked(n: int) -> str:
+    # demo masked PAN derived from the card number (do not generate real PANs)
+    return "**** **** **** " + str(1000 + (n % 9000))
+
+def ensure_card_for_application(db: Session, app_id: UUID, by: str | None = None):
     a = db.get(models.CardApplication, app_id)
     if not a:
         raise ValueError("Application not found")
     # must be approved or in batch
-    cur_code = db.get(models.RefStatus, a.status_id).code
+    cur_code = get_status_code(db, a.status_id)
     if cur_code not in {"APPROVED", "IN_BATCH"}:
         raise ValueError("Card can be created only for APPROVED/IN_BATCH applications")
 
@@ -501,17 +1028,12 @@ def ensure_card_for_application(db: Session, app_id: UUID, by: str | None = None
     if existing:
         return existing
 
-    year = utcnow().year
-    seq = next_seq(db, "card_seq")
-    card_no = make_no("CARD", year, seq, 6)
-
+    card_no = make_no("CARD", utcnow().year, allocator.next(db, "card_seq"), 6)
     sid = get_status_id(db, "card", "CREATED")
-    c = models.Card(card_no=card_no, application_id=app_id, status_id=sid)
-    db.add(c)
-    db.commit()
-    db.refresh(c)
-
-    add_history(db, "card", c.id, sid, by)
+    _batch_counters(db, -1, app_ids=[app_id])
+    c = insert_with_history(db, models.Card, "card", {"card_no": card_no, "application_id": app_id, "status_id": sid}, by)
+    _batch_counters(db, +1, app_ids=[app_id])
+    refresh_app_view(db, [app_id])
     db.commit()
     return c
 
@@ -521,7 +1043,7 @@ def card_event(db: Session, card_id: UUID, event: str, by: str | None = None) ->
         raise ValueError("Card not found")
 
     now = utcnow()
-    current_code = db.get(models.RefStatus, c.status_id).code
+    current_code = get_status_code(db, c.status_id)
 
     mapping = {
         "issued": "ISSUED",
@@ -537,12 +1059,12 @@ def card_event(db: Session, card_id: UUID, event: str, by: str | None = None) ->
     if next_code not in CARD_ALLOWED.get(current_code, set()):
         raise ValueError(f"Transition {current_code} -> {next_code} is not allowed")
 
+    _batch_counters(db, -1, app_ids=[c.application_id])
     # set timestamps + demo PAN
     if next_code == "ISSUED":
         c.issued_at = now
         if not c.pan_masked:
-            # demo masked PAN (do not generate real PANs)
-            c.pan_masked = "**** **** **** " + str(1000 + (next_seq(db, "card_seq") % 9000))
+            c.pan_masked = demo_pan_masked(int(c.card_no.rsplit("-", 1)[-1]))
         if not c.expiry_month:
             c.expiry_month = 12
         if not c.expiry_year:
@@ -557,13 +1079,60 @@ def card_event(db: Session, card_id: UUID, event: str, by: str | None = None) ->
         c.closed_at = now
 
     c.status_id = set_status(db, "card", c.id, next_code, by)
+    _batch_counters(db, +1, app_ids=[c.application_id])
+    rollup.refresh(db, [c.application_id])
+    refresh_app_view(db, [c.application_id])
     db.commit()
     db.refresh(c)
     return c
 
-def list_cards(db: Session, limit: int, offset: int):
-    total = db.execute(text("SELECT count(*) FROM card")).scalar_one()
-    sql = text("""
+# fields= for /api/cards: each object lists its keys and the joins it needs
+_CARD_OBJECTS = {
+    "status": ({"id": "s.id", "code": "s.code", "name": "s.name", "is_active": "true"},
+               ("JOIN ref_status s ON s.id=c.status_id",)),
+    "application": ({"id": "a.id", "application_no": "a.application_no"},
+                    ("JOIN card_application a ON a.id=c.application_id",)),
+    "client": ({"id": "cl.id", "full_name": "cl.full_name", "phone": "cl.phone"},
+               ("JOIN card_application a ON a.id=c.application_id", "JOIN client cl ON cl.id=a.client_id")),
+    "batch": ({"id": "b.id", "batch_no": "b.batch_no"},
+              ("LEFT JOIN issue_batch_item bi ON bi.application_id=c.application_id",
+               "LEFT JOIN issue_batch b ON b.id=bi.batch_id")),
+}
+_CARD_PRESENT = {"batch": "b.id IS NOT NULL"}
+CARD_FIELD_PRESETS = {
+    # the cards grid
+    "grid": ("id", "card_no", "status.code", "status.name", "client.full_name", "application.application_no",
+             "batch.batch_no", "pan_masked", "expiry_month", "expiry_year",
+             "issued_at", "delivered_at", "handed_at", "activated_at"),
+    "compact": ("id", "card_no", "status.code", "issued_at"),
+}
+
+def _card_field(path: str) -> str | None:
+    head, _, sub = path.partition(".")
+    if head not in _CARD_OBJECTS:
+        return None if sub or head not in models.Card.__table__.c else f"c.{head}"
+    keys = _CARD_OBJECTS[head][0]
+    if sub:
+        return keys.get(sub)
+    expr = "jsonb_build_object(" + ", ".join(f"'{k}', {v}" for k, v in keys.items()) + ")"
+    return f"CASE WHEN {_CARD_PRESENT[head]} THEN {expr} END" if head in _CARD_PRESENT else expr
+
+def list_cards(db: Session, limit: int, offset: int, count: str = "exact", raw: bool = False,
+               fields: list[str] | None = None):
+    total = count_total(db, "cards", "FROM card", {}, count)
+    params = {"limit": limit, "offset": offset}
+    if fields:
+        doc, heads = sparse_doc_sql(fields, _card_field, _CARD_PRESENT)
+        joins = list(dict.fromkeys(j for h in _CARD_OBJECTS if h in heads for j in _CARD_OBJECTS[h][1]))
+        sql = f"""
+          SELECT ({doc}){'::text' if raw else ''} AS doc
+          FROM card c
+          {' '.join(joins)}
+          ORDER BY c.issued_at DESC NULLS LAST, c.id DESC
+          LIMIT :limit OFFSET :offset
+        """
+        return total, db.execute(text(sql), params).scalars().all()
+    sql = """
       SELECT
         c.*,
         jsonb_build_object('id', s.id, 'code', s.code, 'name', s.name, 'is_active', true) AS status,
@@ -578,15 +1147,45 @@ def list_cards(db: Session, limit: int, offset: int):
       LEFT JOIN issue_batch b ON b.id=bi.batch_id
       ORDER BY c.issued_at DESC NULLS LAST, c.id DESC
       LIMIT :limit OFFSET :offset
-    """)
-    rows = db.execute(sql, {"limit": limit, "offset": offset}).mappings().all()
+    """
+    if raw:
+        sql = json_rows_sql(sql, "q.issued_at DESC NULLS LAST, q.id DESC")
+        return total, db.execute(text(sql), {"limit": limit, "offset": offset}).scalars().all()
+    rows = db.execute(text(sql), {"limit": limit, "offset": offset}).mappings().all()
     return total, rows
 
 # --------------------
 # Reports (for charts)
 # --------------------
-
-def report_funnel(db: Session, date_from: datetime, date_to: datetime):
+# source="rollup" (default) reads report_daily: whole days, a few hundred rows at most.
+# source="live" scans card_application/card over the exact timestamp range.
+
+REPORT_SOURCES = ("rollup", "live")
+
+def _rollup_range(date_from: datetime, date_to: datetime) -> tuple[str, dict]:
+    # days overlapping [date_from, date_to)
+    return "day >= CAST(:df AS date) AND day < :dt", {"df": date_from, "dt": date_to}
+
+def _check_source(source: str):
+    if source not in REPORT_SOURCES:
+        raise ValueError("source must be one of: " + ", ".join(REPORT_SOURCES))
+
+def report_funnel(db: Session, date_from: datetime, date_to: datetime, source: str = "rollup"):
+    _check_source(source)
+    if source == "rollup":
+        where, params = _rollup_range(date_from, date_to)
+        q = text(f"""
+        SELECT
+          COALESCE(sum(applications), 0) AS applications,
+          COALESCE(sum(approved), 0) AS approved,
+          COALESCE(sum(rejected), 0) AS rejected,
+          COALESCE(sum(issued), 0) AS issued,
+          COALESCE(sum(handed), 0) AS handed,
+          COALESCE(sum(activated), 0) AS activated
+        FROM report_daily
+        WHERE {where}
+        """)
+        return dict(db.execute(q, params).mappings().one())
     q = text("""
     WITH base AS (
       SELECT a.id, a.status_id
@@ -607,41 +1206,68 @@ def report_funnel(db: Session, date_from: datetime, date_to: datetime):
     """)
     return dict(db.execute(q, {"df": date_from, "dt": date_to}).mappings().one())
 
-def report_volume(db: Session, date_from: datetime, date_to: datetime, bucket: str = "day"):
-    trunc = "day" if bucket == "day" else "month"
+VOLUME_BUCKETS = ("day", "week", "month", "quarter")
+
+def report_volume(db: Session, date_from: datetime, date_to: datetime, bucket: str = "day", source: str = "rollup"):
+    _check_source(source)
+    if bucket not in VOLUME_BUCKETS:
+        raise ValueError("bucket must be one of: " + ", ".join(VOLUME_BUCKETS))
+    if source == "rollup":
+        where, params = _rollup_range(date_from, date_to)
+        q = text(f"""
+        SELECT
+          date_trunc('{bucket}', day)::date::text AS bucket,
+          sum(applications) AS applications,
+          sum(approved) AS approved,
+          sum(issued) AS issued,
+          sum(activated) AS activated
+        FROM report_daily
+        WHERE {where}
+        GROUP BY 1
+        ORDER BY 1
+        """)
+        rows = db.execute(q, params).mappings().all()
+        return {"points": [dict(r) for r in rows]}
+    # single pass at application grain: card is 1:1 with the application, so no fan-out
     q = text(f"""
-    WITH base AS (
-      SELECT date_trunc('{trunc}', a.requested_at)::date AS bucket,
-             s.code AS app_status,
-             a.id AS app_id
-      FROM card_application a
-      JOIN ref_status s ON s.id=a.status_id
-      WHERE a.requested_at >= :df AND a.requested_at < :dt
-    ),
-    cards AS (
-      SELECT date_trunc('{trunc}', a.requested_at)::date AS bucket,
-             c.issued_at IS NOT NULL AS issued,
-             c.activated_at IS NOT NULL AS activated
-      FROM card_application a
-      LEFT JOIN card c ON c.application_id=a.id
-      WHERE a.requested_at >= :df AND a.requested_at < :dt
-    )
     SELECT
-      b.bucket::text AS bucket,
+      date_trunc('{bucket}', a.requested_at)::date::text AS bucket,
       count(*) AS applications,
-      count(*) FILTER (WHERE b.app_status IN ('APPROVED','IN_BATCH')) AS approved,
-      count(*) FILTER (WHERE c.issued) AS issued,
-      count(*) FILTER (WHERE c.activated) AS activated
-    FROM base b
-    JOIN cards c ON c.bucket=b.bucket
+      count(*) FILTER (WHERE a.status_id IN (:approved, :in_batch)) AS approved,
+      count(c.issued_at) AS issued,
+      count(c.activated_at) AS activated
+    FROM card_application a
+    LEFT JOIN card c ON c.application_id=a.id
+    WHERE a.requested_at >= :df AND a.requested_at < :dt
     GROUP BY 1
     ORDER BY 1
     """)
-    rows = db.execute(q, {"df": date_from, "dt": date_to}).mappings().all()
+    rows = db.execute(q, {
+        "df": date_from, "dt": date_to,
+        "approved": get_status_id(db, "application", "APPROVED"),
+        "in_batch": get_status_id(db, "application", "IN_BATCH"),
+    }).mappings().all()
     return {"points": [dict(r) for r in rows]}
 
-def report_sla(db: Session, date_from: datetime, date_to: datetime, bucket: str = "month"):
+def report_sla(db: Session, date_from: datetime, date_to: datetime, bucket: str = "month", source: str = "rollup"):
+    _check_source(source)
     trunc = "month" if bucket == "month" else "week"
+    if source == "rollup":
+        where, params = _rollup_range(date_from, date_to)
+        q = text(f"""
+        SELECT
+          date_trunc('{trunc}', day)::date::text AS bucket,
+          sum(decision_sec) / NULLIF(sum(decision_n), 0) / 86400.0 AS days_to_decision_avg,
+          sum(issue_sec) / NULLIF(sum(issue_n), 0) / 86400.0 AS days_to_issue_avg,
+          sum(delivery_sec) / NULLIF(sum(delivery_n), 0) / 86400.0 AS days_delivery_avg,
+          sum(activate_sec) / NULLIF(sum(activate_n), 0) / 86400.0 AS days_to_activate_avg
+        FROM report_daily
+        WHERE {where}
+        GROUP BY 1
+        ORDER BY 1
+        """)
+        rows = db.execute(q, params).mappings().all()
+        return {"points": [dict(r) for r in rows]}
     q = text(f"""
     SELECT
       date_trunc('{trunc}', a.requested_at)::date::text AS bucket,
@@ -658,7 +1284,21 @@ def report_sla(db: Session, date_from: datetime, date_to: datetime, bucket: str
     rows = db.execute(q, {"df": date_from, "dt": date_to}).mappings().all()
     return {"points": [dict(r) for r in rows]}
 
-def report_reject_reasons(db: Session, date_from: datetime, date_to: datetime):
+def report_reject_reasons(db: Session, date_from: datetime, date_to: datetime, source: str = "rollup"):
+    _check_source(source)
+    if source == "rollup":
+        where, params = _rollup_range(date_from, date_to)
+        q = text(f"""
+        SELECT COALESCE(rr.name, 'Не указано') AS reason, sum(r.value::int) AS count
+        FROM report_daily d
+        CROSS JOIN LATERAL jsonb_each_text(d.rejected_by_reason) r
+        LEFT JOIN ref_reject_reason rr ON rr.id::text=r.key
+        WHERE {where}
+        GROUP BY 1
+        ORDER BY count DESC, reason
+        """)
+        rows = db.execute(q, params).mappings().all()
+        return {"points": [dict(r) for r in rows]}
     q = text("""
     SELECT COALESCE(rr.name, 'Не указано') AS reason, COUNT(*) AS count
     FROM card_application a
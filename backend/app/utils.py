@@ -1,4 +1,6 @@
 from __future__ import annotations
+import base64
+import json
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy import text
@@ -6,8 +8,25 @@ from sqlalchemy import text
 def utcnow() -> datetime:
     return datetime.utcnow()
 
-def next_seq(db: Session, seq_name: str) -> int:
-    return int(db.execute(text(f"SELECT nextval('{seq_name}')")).scalar_one())
+def next_seq_block(db: Session, seq_name: str, n: int) -> list[int]:
+    # n values in one round trip (not guaranteed contiguous under concurrency)
+    if n <= 0:
+        return []
+    rows = db.execute(text(f"SELECT nextval('{seq_name}') FROM generate_series(1, :n)"), {"n": n}).scalars().all()
+    return [int(x) for x in rows]
 
 def make_no(prefix: str, year: int, n: int, width: int = 6) -> str:
     return f"{prefix}-{year}-{n:0{width}d}"
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else str(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, n: int) -> list[str]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(values, list) or len(values) != n:
+        raise ValueError("Invalid cursor")
+    return values
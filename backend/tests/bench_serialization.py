@@ -0,0 +1,84 @@
+"""Micro-benchmark: per-row cost of serializing a clients page.
+
+old: ClientOut.model_validate(row).model_dump() per row, jsonable_encoder, stdlib-json JSONResponse
+new: schemas.rows_out + FastJSONResponse (orjson)
+
+Run from backend/: python -m tests.bench_serialization [--rows 10000] [--repeat 5]
+No database needed: rows are transient ORM objects.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg://bench@localhost/bench")  # engine is never connected
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app import models, schemas
+from app.cache import FastJSONResponse
+
+
+def make_rows(n: int) -> list[models.Client]:
+    base = datetime(2024, 1, 1, 9, 30)
+    return [
+        models.Client(
+            id=uuid.uuid4(), client_type="person", full_name=f"Иванов Иван Иванович {i}", phone=f"+7 900 {i:07d}",
+            email=f"client{i}@example.com", birth_date=date(1980, 1, 1) + timedelta(days=i % 9000),
+            gender="M", citizenship="RU", doc_type="паспорт", doc_number=f"{4500 + i % 500} {i:06d}",
+            doc_issue_date=date(2010, 5, 17), doc_issuer="ОУФМС России по г. Москве",
+            reg_address=f"г. Москва, ул. Тверская, д. {i % 200}", fact_address=None,
+            segment="mass", kyc_status="passed", risk_level="low", note=None,
+            created_at=base + timedelta(minutes=i), updated_at=base + timedelta(minutes=i, seconds=30),
+        )
+        for i in range(n)
+    ]
+
+
+def _page(items: list) -> dict:
+    return {"meta": {"total": len(items), "limit": len(items), "offset": 0}, "items": items}
+
+
+def old_way(rows) -> bytes:
+    items = [schemas.ClientOut.model_validate(x).model_dump() for x in rows]
+    return JSONResponse(jsonable_encoder(_page(items))).body
+
+
+def new_way(rows) -> bytes:
+    return FastJSONResponse(_page(schemas.rows_out(schemas.ClientOut, rows))).body
+
+
+def bench(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    old_body, new_body = old_way(rows), new_way(rows)
+    assert json.loads(old_body) == json.loads(new_body), "old and new payloads differ"
+
+    t_old, t_new = bench(old_way, rows, args.repeat), bench(new_way, rows, args.repeat)
+    per_row = lambda t: t / args.rows * 1e6
+    print(f"{args.rows} rows, best of {args.repeat}")
+    print(f"old  {t_old * 1000:8.1f} ms  {per_row(t_old):6.2f} us/row  {len(old_body)} bytes")
+    print(f"new  {t_new * 1000:8.1f} ms  {per_row(t_new):6.2f} us/row  {len(new_body)} bytes")
+    print(f"speedup x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import pytest
+
+# Tests run against a migrated Postgres (DATABASE_URL, e.g. the docker-compose db after `alembic upgrade head`);
+# modules that need it skip themselves when DATABASE_URL is not set.
+# Each test works inside one outer transaction that is rolled back, so the database is left as it was;
+# service-level commits only release a savepoint.
+
+
+@pytest.fixture
+def db():
+    from sqlalchemy.orm import Session
+
+    from app.cache import status_resolver
+    from app.db import engine
+    from app.seed import _ensure_statuses
+
+    conn = engine.connect()
+    outer = conn.begin()
+    session = Session(bind=conn, join_transaction_mode="create_savepoint")
+    try:
+        _ensure_statuses(session)
+        yield session
+    finally:
+        session.close()
+        outer.rollback()
+        conn.close()
+        # ids of statuses created inside the rolled-back transaction must not outlive it
+        status_resolver.invalidate()
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+# settings need a DATABASE_URL, the renderer never connects; set only while importing (and in the pool
+# test, for the spawned workers) so database tests still skip themselves without a real one
+PLACEHOLDER_URL = "postgresql+psycopg://test@localhost/test"
+
+_had_url = "DATABASE_URL" in os.environ
+os.environ.setdefault("DATABASE_URL", PLACEHOLDER_URL)
+try:
+    from app import pdf
+except (ImportError, OSError) as e:  # WeasyPrint needs pango/cairo from the system
+    pytest.skip(f"WeasyPrint is not usable here: {e}", allow_module_level=True)
+finally:
+    if not _had_url:
+        del os.environ["DATABASE_URL"]
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+# The renderers warm up at startup with pdf.SAMPLE_CONTEXT; a warm-up that cannot render a form kills
+# every worker in its initializer and the API does not boot.
+
+
+@pytest.mark.parametrize("template", pdf.PRINT_TEMPLATES)
+def test_sample_context_covers_print_templates(template):
+    strict = Environment(loader=FileSystemLoader(pdf.TEMPLATE_DIR), undefined=StrictUndefined)
+    assert strict.get_template(template).render(**pdf.SAMPLE_CONTEXT)
+
+
+def test_warm_up_renders_sample_forms():
+    report = pdf.warm_up()
+    assert report["pid"] == os.getpid()
+    assert report["cold_ms"] > 0 and report["warm_ms"] > 0
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_pool_start_reports_every_worker(workers, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", os.environ.get("DATABASE_URL", PLACEHOLDER_URL))
+    pool = pdf.RenderPool(workers, queue_max=1, timeout=60, retry_after=1)
+    try:
+        reports = pool.start()
+        assert [r for r in reports if "error" in r] == []
+        assert len({r["pid"] for r in reports}) == max(workers, 1)
+        assert pool.metrics()["warmup"] == reports
+    finally:
+        pool.shutdown()
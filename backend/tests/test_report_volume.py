@@ -0,0 +1,124 @@
+import os
+import random
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+
+if not os.environ.get("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from sqlalchemy import text
+
+from app import models, service
+
+# report_volume(source="live") counts every bucket in one scan with FILTER aggregates; this checks it
+# against a naive query per bucket over generated applications that sit on bucket edges.
+# Far-future dates keep the generated rows apart from whatever else the database holds.
+
+DF, DT = datetime(2090, 12, 1), datetime(2092, 1, 1)
+EPS = timedelta(microseconds=1)
+
+EDGES = [
+    datetime(2090, 12, 1),                      # range start
+    datetime(2091, 1, 1) - EPS,                 # Sunday, last instant of 2090 (week, month, quarter edge)
+    datetime(2091, 1, 1),                       # Monday
+    datetime(2091, 1, 7, 23, 59, 59, 999999),   # Sunday
+    datetime(2091, 1, 8),                       # Monday
+    datetime(2091, 3, 31, 23, 59, 59, 999999),  # quarter end
+    datetime(2091, 4, 1),                       # quarter start
+    datetime(2091, 6, 30, 12),
+    datetime(2091, 7, 1),
+    datetime(2091, 9, 30, 23, 59, 59, 999999),
+    datetime(2091, 10, 1),
+    datetime(2092, 1, 1) - EPS,                 # range end (exclusive bound)
+    datetime(2092, 1, 1),                       # outside the range
+    datetime(2090, 11, 30, 23, 59, 59),         # outside the range
+]
+
+
+def _bucket_start(d: date, bucket: str) -> date:
+    if bucket == "day":
+        return d
+    if bucket == "week":
+        return d - timedelta(days=d.weekday())
+    if bucket == "month":
+        return d.replace(day=1)
+    return date(d.year, 3 * ((d.month - 1) // 3) + 1, 1)
+
+
+def _bucket_next(start: date, bucket: str) -> date:
+    if bucket == "day":
+        return start + timedelta(days=1)
+    if bucket == "week":
+        return start + timedelta(days=7)
+    months = 1 if bucket == "month" else 3
+    y, m = divmod(start.month - 1 + months, 12)
+    return date(start.year + y, m + 1, 1)
+
+
+NAIVE = text("""
+  SELECT
+    (SELECT count(*) FROM card_application a
+      WHERE a.requested_at >= :b0 AND a.requested_at < :b1) AS applications,
+    (SELECT count(*) FROM card_application a JOIN ref_status s ON s.id=a.status_id
+      WHERE a.requested_at >= :b0 AND a.requested_at < :b1 AND s.code IN ('APPROVED', 'IN_BATCH')) AS approved,
+    (SELECT count(*) FROM card c JOIN card_application a ON a.id=c.application_id
+      WHERE a.requested_at >= :b0 AND a.requested_at < :b1 AND c.issued_at IS NOT NULL) AS issued,
+    (SELECT count(*) FROM card c JOIN card_application a ON a.id=c.application_id
+      WHERE a.requested_at >= :b0 AND a.requested_at < :b1 AND c.activated_at IS NOT NULL) AS activated
+""")
+
+
+@pytest.fixture
+def volume_data(db):
+    rnd = random.Random(7)
+    tag = uuid.uuid4().hex[:8].upper()
+    refs = dict(
+        product=models.RefCardProduct(code=f"T-{tag}", name="Test", payment_system="MIR", level="Classic"),
+        tariff=models.RefTariffPlan(code=f"T-{tag}", name="Test"),
+        channel=models.RefChannel(code=f"T-{tag}", name="Test"),
+        branch=models.RefBranch(code=f"T-{tag}", name="Test", city="Test", address="Test"),
+        delivery=models.RefDeliveryMethod(code=f"T-{tag}", name="Test"),
+        client=models.Client(full_name="Test Client"),
+    )
+    db.add_all(refs.values())
+    db.flush()
+
+    app_codes = ("NEW", "IN_REVIEW", "APPROVED", "IN_BATCH", "REJECTED")
+    stamps = EDGES + [DF + timedelta(seconds=rnd.randrange(int((DT - DF).total_seconds()))) for _ in range(300)]
+    for i, at in enumerate(stamps):
+        a = models.CardApplication(
+            application_no=f"T{tag}-{i:06d}", client_id=refs["client"].id, product_id=refs["product"].id,
+            tariff_id=refs["tariff"].id, channel_id=refs["channel"].id, branch_id=refs["branch"].id,
+            delivery_method_id=refs["delivery"].id, requested_at=at,
+            status_id=service.get_status_id(db, "application", rnd.choice(app_codes)),
+        )
+        db.add(a)
+        db.flush()
+        if rnd.random() < 0.6:
+            issued = at + timedelta(days=3) if rnd.random() < 0.8 else None
+            activated = issued + timedelta(days=5) if issued and rnd.random() < 0.5 else None
+            db.add(models.Card(card_no=f"TC{tag}-{i:06d}", application_id=a.id,
+                               status_id=service.get_status_id(db, "card", "ISSUED"),
+                               issued_at=issued, activated_at=activated))
+    db.flush()
+    return stamps
+
+
+@pytest.mark.parametrize("bucket", ["day", "week", "month", "quarter"])
+def test_live_volume_matches_naive_per_bucket_counts(db, volume_data, bucket):
+    got = {p["bucket"]: {k: int(v) for k, v in p.items() if k != "bucket"}
+           for p in service.report_volume(db, DF, DT, bucket=bucket, source="live")["points"]}
+
+    starts = sorted({_bucket_start(at.date(), bucket) for at in volume_data if DF <= at < DT})
+    expected = {}
+    for b0 in starts:
+        # clamp to the report range: edge buckets only count what falls inside it
+        lo = max(datetime.combine(b0, datetime.min.time()), DF)
+        hi = min(datetime.combine(_bucket_next(b0, bucket), datetime.min.time()), DT)
+        row = db.execute(NAIVE, {"b0": lo, "b1": hi}).mappings().one()
+        expected[b0.isoformat()] = {k: int(v) for k, v in row.items()}
+
+    assert got == expected
+    assert sum(p["applications"] for p in got.values()) == sum(1 for at in volume_data if DF <= at < DT)
@@ -51,6 +51,7 @@ export async function listApplications(params: {
   date_to?: string;
   limit: number;
   offset: number;
+  fields?: string;
 }): Promise<Page<ApplicationRow>> {
   const sp = new URLSearchParams();
   if (params.q) sp.set("q", params.q);
@@ -58,6 +59,7 @@ export async function listApplications(params: {
   if (params.date_to) sp.set("date_to", params.date_to);
   sp.set("limit", String(params.limit));
   sp.set("offset", String(params.offset));
+  if (params.fields) sp.set("fields", params.fields);
   (params.statuses ?? []).forEach((s) => sp.append("statuses", s));
   const { data } = await http.get(`/api/applications?${sp.toString()}`);
   return data;
@@ -132,8 +134,8 @@ export async function setBatchStatus(batchId: string, status: string): Promise<a
 }
 
 // ---------- Cards ----------
-export async function listCards(limit: number, offset: number): Promise<Page<CardRow>> {
-  const { data } = await http.get("/api/cards", { params: { limit, offset } });
+export async function listCards(limit: number, offset: number, fields?: string): Promise<Page<CardRow>> {
+  const { data } = await http.get("/api/cards", { params: { limit, offset, fields } });
   return data;
 }
 
@@ -147,7 +149,7 @@ export async function reportFunnel(): Promise<FunnelReport> {
   const { data } = await http.get("/api/reports/funnel");
   return data;
 }
-export async function reportVolume(params: { bucket?: "day" | "week" | "month" } = {}): Promise<VolumeReport> {
+export async function reportVolume(params: { bucket?: "day" | "week" | "month" | "quarter" } = {}): Promise<VolumeReport> {
   const { data } = await http.get("/api/reports/volume", { params });
   return data;
 }
@@ -1,4 +1,5 @@
-export type PageMeta = { total: number; limit: number; offset: number };
+// total is null with count=none; total_source says whether it is an exact count or a planner estimate
+export type PageMeta = { total: number | null; total_source?: "exact" | "cached" | "estimate" | null; limit: number; offset: number };
 export type Page<T> = { meta: PageMeta; items: T[] };
 
 export type RefItem = { id: number; code: string; name: string; is_active: boolean };
@@ -32,7 +32,7 @@ import {
   updateApplication,
 } from "../api/queries";
 import type { ApplicationRow } from "../api/types";
-import { fmtDate, fmtDateTime, money } from "../utils/format";
+import { fmtDate, fmtDateTime, fmtTotal, money } from "../utils/format";
 import { useMeta } from "../state/meta";
 import AddIcon from "@mui/icons-material/Add";
 import GavelIcon from "@mui/icons-material/Gavel";
@@ -106,6 +106,7 @@ export default function Applications() {
   });
 
   const rows = query.data?.items ?? [];
+  const total = fmtTotal(query.data?.meta);
 
   const columns: GridColDef<ApplicationRow>[] = [
     {
@@ -254,7 +255,7 @@ export default function Applications() {
               <MenuItem value="REJECTED">Отказы</MenuItem>
             </TextField>
             <Box sx={{ flex: 1 }} />
-            <Chip label={`Найдено: ${query.data?.meta.total ?? 0}`} sx={{ fontWeight: 800 }} />
+            <Chip label={total != null ? `Найдено: ${total}` : `Показано: ${rows.length}`} sx={{ fontWeight: 800 }} />
           </Stack>
 
           {query.isLoading ? <LinearProgress sx={{ mb: 1.5 }} /> : null}
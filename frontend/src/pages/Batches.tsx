@@ -316,7 +316,7 @@ function AddItemsDialog({
 
   const apps = useQuery({
     queryKey: ["apps-approved", q],
-    queryFn: () => listApplications({ q: q || undefined, statuses: ["APPROVED"], limit: 200, offset: 0 }),
+    queryFn: () => listApplications({ q: q || undefined, statuses: ["APPROVED"], limit: 200, offset: 0, fields: "compact" }),
     enabled: open,
   });
 
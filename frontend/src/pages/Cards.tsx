@@ -15,7 +15,7 @@ import { useToast } from "../state/toast";
 
 export default function Cards() {
   const toast = useToast();
-  const query = useQuery({ queryKey: ["cards"], queryFn: () => listCards(200, 0) });
+  const query = useQuery({ queryKey: ["cards"], queryFn: () => listCards(200, 0, "grid") });
 
   const eventMut = useMutation({
     mutationFn: ({ id, event }: { id: string; event: string }) => cardEvent(id, { event, by: "Оператор" }),
@@ -1,4 +1,5 @@
 import dayjs from "dayjs";
+import type { PageMeta } from "../api/types";
 
 export function fmtDateTime(v?: string | null): string {
   if (!v) return "—";
@@ -18,3 +19,8 @@ export function initials(name: string): string {
   const b = parts[1]?.[0] || "";
   return (a + b).toUpperCase();
 }
+export function fmtTotal(meta?: PageMeta): string | null {
+  // null when the list was fetched without a total (count=none); planner estimates are marked "≈"
+  if (meta?.total == null) return null;
+  return meta.total_source === "estimate" ? `≈${meta.total}` : String(meta.total);
+}